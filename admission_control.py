@@ -0,0 +1,252 @@
+"""
+Admission Control
+Bounds the conversions a server takes on at once. Every request carries an
+estimated cost (bytes of input images); a request is admitted while both
+the number of admitted requests and their total cost stay within limits.
+Others wait in a bounded first-come-first-served queue for a limited time,
+so under overload requests are turned away quickly instead of piling up
+behind each other.
+
+Usage:
+    ticket = await admission.acquire(cost)
+    try:
+        ...  # convert
+    finally:
+        admission.release(ticket)
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Optional
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest conversion in the seconds-per-byte estimate
+COST_RATE_SMOOTHING = 0.2
+# Bounds for the Retry-After hint, in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 300
+
+
+class AdmissionRejectedError(RuntimeError):
+    """
+    Raised when a request is not admitted.
+
+    status_code is 429 when the wait queue is full and 503 when the request
+    waited for its turn without getting one; retry_after is a hint in
+    seconds for when capacity is likely to be available.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """An admitted request's cost, held until it is released"""
+
+    def __init__(self, cost: int, requested_cost: int):
+        self.cost = cost
+        self.requested_cost = requested_cost
+        self.admitted_at = time.perf_counter()
+        self.released = False
+
+
+class _Waiter:
+    def __init__(self, cost: int, requested_cost: int, future: asyncio.Future):
+        self.cost = cost
+        self.requested_cost = requested_cost
+        self.future = future
+
+
+class AdmissionController:
+    """
+    Weighted concurrency limit with a bounded wait queue.
+
+    A request costing more than the whole capacity is counted at the
+    capacity, so it runs on its own rather than never. Waiters are admitted
+    strictly in arrival order, so a large request is not starved by a
+    stream of small ones. All methods must be called on the event loop.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        capacity: int,
+        max_queued: int = 100,
+        max_wait_seconds: float = 10.0
+    ):
+        self.max_concurrent = max_concurrent
+        self.capacity = capacity
+        self.max_queued = max_queued
+        self.max_wait_seconds = max_wait_seconds
+        self.in_flight = 0
+        self.in_flight_cost = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # Smoothed conversion time per byte of cost, for Retry-After hints
+        self.seconds_per_cost: Optional[float] = None
+        self._waiters: Deque[_Waiter] = deque()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether requests are limited at all"""
+        return self.max_concurrent > 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting to be admitted"""
+        return len(self._waiters)
+
+    @property
+    def queued_cost(self) -> int:
+        """Total cost of the requests waiting to be admitted"""
+        return sum(waiter.cost for waiter in self._waiters)
+
+    async def acquire(self, cost: int) -> AdmissionTicket:
+        """
+        Admit a request, waiting for capacity if necessary.
+
+        Args:
+            cost: Estimated cost of the request in bytes
+
+        Returns:
+            A ticket to pass to release() once the request is done
+
+        Raises:
+            AdmissionRejectedError: If the queue is full (429) or no
+                capacity became free within max_wait_seconds (503)
+        """
+        requested_cost = max(0, cost)
+        cost = min(requested_cost, self.capacity)
+        if not self.enabled:
+            return AdmissionTicket(cost, requested_cost)
+
+        if not self._waiters and self._fits(cost):
+            return self._admit(cost, requested_cost)
+
+        self._reject_if_queue_full(cost)
+        waiter = _Waiter(cost, requested_cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter.future, self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._remove_waiter(waiter)
+            self.timed_out += 1
+            raise AdmissionRejectedError(
+                f"Server is busy: no capacity for a conversion of {requested_cost} bytes "
+                f"within {self.max_wait_seconds}s",
+                status_code=503,
+                retry_after=self.retry_after(cost)
+            )
+        except asyncio.CancelledError:
+            # Admitted just as the client went away: give the capacity back
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(waiter.future.result())
+            self._remove_waiter(waiter)
+            raise
+
+    def check_queue(self) -> None:
+        """
+        Turn a request away before its cost is known if acquire() would anyway.
+
+        A request has to wait whatever its cost while others are waiting or
+        the concurrency limit is reached; if the queue is full as well,
+        estimating its cost is wasted work.
+
+        Raises:
+            AdmissionRejectedError: If the request would have to wait and
+                the queue is full (429)
+        """
+        if self.enabled and (self._waiters or self.in_flight >= self.max_concurrent):
+            self._reject_if_queue_full()
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """Return an admitted request's capacity and admit waiting requests; releasing twice is harmless"""
+        if ticket.released:
+            return
+        ticket.released = True
+        if not self.enabled:
+            return
+        self.in_flight -= 1
+        self.in_flight_cost -= ticket.cost
+        if ticket.requested_cost > 0:
+            observed = (time.perf_counter() - ticket.admitted_at) / ticket.requested_cost
+            if self.seconds_per_cost is None:
+                self.seconds_per_cost = observed
+            else:
+                self.seconds_per_cost += COST_RATE_SMOOTHING * (observed - self.seconds_per_cost)
+        self._admit_waiters()
+
+    def retry_after(self, cost: int = 0) -> int:
+        """
+        Estimate how many seconds until a request of this cost would be admitted.
+
+        The work admitted or queued ahead of it is divided over the
+        concurrency limit at the recently observed conversion rate.
+        """
+        if self.seconds_per_cost is None:
+            estimate = self.max_wait_seconds
+        else:
+            backlog = self.in_flight_cost + self.queued_cost + cost
+            estimate = backlog * self.seconds_per_cost / max(1, self.max_concurrent)
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(estimate))))
+
+    def stats(self) -> dict:
+        """Return the limits, current load and counters"""
+        return {
+            "enabled": self.enabled,
+            "max_concurrent": self.max_concurrent,
+            "capacity": self.capacity,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "in_flight_cost": self.in_flight_cost,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def _reject_if_queue_full(self, cost: int = 0) -> None:
+        if len(self._waiters) >= self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejectedError(
+                f"Server is busy: {self.in_flight} conversions running and "
+                f"{len(self._waiters)} waiting",
+                status_code=429,
+                retry_after=self.retry_after(cost)
+            )
+
+    def _fits(self, cost: int) -> bool:
+        return self.in_flight < self.max_concurrent and self.in_flight_cost + cost <= self.capacity
+
+    def _admit(self, cost: int, requested_cost: int) -> AdmissionTicket:
+        self.in_flight += 1
+        self.in_flight_cost += cost
+        self.admitted += 1
+        return AdmissionTicket(cost, requested_cost)
+
+    def _admit_waiters(self) -> None:
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.future.done():
+                # Timed out or cancelled; its task removes it too
+                self._waiters.popleft()
+                continue
+            if not self._fits(waiter.cost):
+                break
+            self._waiters.popleft()
+            waiter.future.set_result(self._admit(waiter.cost, waiter.requested_cost))
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        # A large waiter leaving the head of the queue may unblock smaller ones
+        self._admit_waiters()
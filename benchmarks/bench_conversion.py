@@ -0,0 +1,242 @@
+"""
+Conversion benchmark suite
+Converts deterministic synthetic corpora (see synthetic_corpus.py) through
+convert_images_to_pdf, the /convert/upload endpoint and the CLI convert mode,
+and records wall time, pages/s, input MB/s, peak RSS and output size.
+
+Every measurement runs in a fresh subprocess, so peak RSS reflects only that
+conversion and no caches carry over. The result caches are disabled and the
+upload endpoint converts in-process (PDF_CONVERTER_WORKERS=0); its peak RSS
+includes the test client holding the request body.
+
+Results are written as JSON together with the environment (Python, Pillow and
+img2pdf versions, CPU count, git commit) and each corpus's digest. Pass an
+earlier results file with --compare to print the change for every case.
+
+Usage:
+    python benchmarks/bench_conversion.py --counts 1 10 100 1000 --output results.json
+    python benchmarks/bench_conversion.py --counts 10000 --formats jpeg --targets function
+    python benchmarks/bench_conversion.py --output new.json --compare results.json
+"""
+
+import argparse
+import json
+import mmap
+import os
+import platform
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from synthetic_corpus import FORMATS, make_corpus, parse_resolution
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TARGETS = ("function", "upload", "cli")
+
+# Disabled in every child so each run measures a real conversion
+CACHE_VARIABLES = ("PDF_CONVERTER_CACHE_DIR", "PDF_CONVERTER_FRAGMENT_CACHE_DIR")
+
+# Page count of a PDF page tree
+PAGE_COUNT = re.compile(rb"/Count\s+(\d+)")
+
+
+def _peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 1024), 1)
+
+
+def count_pdf_pages(path: str) -> int:
+    """Read the page count from a PDF's page tree; the last one wins, as after an incremental update"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        counts = PAGE_COUNT.findall(data)
+    return int(counts[-1]) if counts else 0
+
+
+def run_child(target: str, input_dir: str, output_pdf: str, streaming: bool) -> None:
+    """Child process entry point: convert once and print the measurement as JSON."""
+    sys.path.insert(0, str(REPO_ROOT))
+    started = None
+
+    if target == "function":
+        from pdf_converter_api_teaching_part import convert_images_to_pdf
+
+        started = time.perf_counter()
+        convert_images_to_pdf(input_dir, output_pdf, streaming=streaming)
+        peak_rss_mb = _peak_rss_mb()
+    elif target == "cli":
+        command = [
+            sys.executable, str(REPO_ROOT / "pdf_converter_api_teaching_part.py"),
+            "--mode", "convert", "--input-dir", input_dir, "--output-pdf", output_pdf,
+        ]
+        if streaming:
+            command.append("--streaming")
+        # Includes interpreter start-up and imports, as a user of the CLI sees it
+        started = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        peak_rss_mb = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    elif target == "upload":
+        from fastapi.testclient import TestClient
+        from pdf_converter_api_teaching_part import app, get_image_files
+
+        paths = get_image_files(Path(input_dir))
+        files = [("files", (path.name, path.read_bytes(), "application/octet-stream")) for path in paths]
+        with TestClient(app) as client:
+            started = time.perf_counter()
+            response = client.post("/convert/upload", files=files)
+            response.raise_for_status()
+            Path(output_pdf).write_bytes(response.content)
+        peak_rss_mb = _peak_rss_mb()
+    else:
+        raise ValueError(f"Unknown target '{target}'")
+
+    wall_seconds = time.perf_counter() - started
+    # Counted from the output, so multi-frame and skipped images are reflected
+    print(json.dumps({
+        "wall_seconds": wall_seconds,
+        "pages": count_pdf_pages(output_pdf),
+        "peak_rss_mb": peak_rss_mb,
+        "output_bytes": Path(output_pdf).stat().st_size,
+    }))
+
+
+def measure(target: str, input_dir: Path, streaming: bool) -> dict:
+    """Run one conversion in a fresh subprocess and return its measurement"""
+    env = {name: value for name, value in os.environ.items() if name not in CACHE_VARIABLES}
+    if target == "upload":
+        env["PDF_CONVERTER_WORKERS"] = "0"
+    with tempfile.TemporaryDirectory() as out_dir:
+        output_pdf = str(Path(out_dir) / "out.pdf")
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", target, str(input_dir), output_pdf,
+             "1" if streaming else "0"],
+            check=True, capture_output=True, text=True, env=env
+        )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def environment() -> dict:
+    """Describe the machine and software versions the results were taken with"""
+    import img2pdf
+    import PIL
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "img2pdf": img2pdf.__version__,
+        "git_commit": commit,
+    }
+
+
+def case_key(row: dict) -> tuple:
+    return (row["target"], row["formats"], row["resolution"], row["count"], row["streaming"])
+
+
+def compare(results: List[dict], baseline_path: str) -> None:
+    """Print the change in wall time and peak RSS against an earlier results file"""
+    baseline = {case_key(row): row for row in json.loads(Path(baseline_path).read_text())["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'target':>9} {'formats':>24} {'count':>6} {'wall':>9} {'peak RSS':>9}")
+    for row in results:
+        before = baseline.get(case_key(row))
+        if before is None:
+            continue
+        if before["corpus_digest"] != row["corpus_digest"]:
+            print(f"{row['target']:>9} {row['formats']:>24} {row['count']:>6}  (different corpus, skipped)")
+            continue
+        wall = row["wall_seconds"] / before["wall_seconds"] - 1 if before["wall_seconds"] else 0.0
+        rss = row["peak_rss_mb"] / before["peak_rss_mb"] - 1 if before["peak_rss_mb"] else 0.0
+        print(f"{row['target']:>9} {row['formats']:>24} {row['count']:>6} {wall:>+9.1%} {rss:>+9.1%}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Conversion benchmark suite")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS),
+                        help="Formats mixed in every corpus")
+    parser.add_argument("--per-format", action="store_true",
+                        help="Also benchmark a corpus of each format on its own")
+    parser.add_argument("--resolutions", type=parse_resolution, nargs="+",
+                        default=[(640, 480), (1654, 2339)], help="WIDTHxHEIGHT, e.g. 1654x2339 (A4 at 200 DPI)")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--streaming", action="store_true", help="Use the streaming writer (function and CLI)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the median wall time is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="Keep generated corpora here and reuse them across runs")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    format_sets = [tuple(args.formats)]
+    if args.per_format and len(args.formats) > 1:
+        format_sets += [(image_format,) for image_format in args.formats]
+
+    corpus_root = Path(args.corpus_dir) if args.corpus_dir else Path(tempfile.mkdtemp(prefix="bench-corpus-"))
+    results = []
+    print(f"{'target':>9} {'formats':>24} {'resolution':>10} {'count':>6} {'wall s':>8} "
+          f"{'pages/s':>8} {'MB/s':>7} {'peak RSS MB':>12} {'output MB':>10}")
+    try:
+        for width, height in args.resolutions:
+            for formats in format_sets:
+                for count in args.counts:
+                    corpus_dir = corpus_root / f"{'-'.join(formats)}_{width}x{height}_{count}_{args.seed}"
+                    corpus = make_corpus(corpus_dir, count, formats, (width, height), args.seed)
+                    for target in args.targets:
+                        runs = [measure(target, corpus_dir, args.streaming) for _ in range(max(1, args.repeat))]
+                        wall = statistics.median(run["wall_seconds"] for run in runs)
+                        pages = runs[-1]["pages"]
+                        row = {
+                            "target": target,
+                            "formats": "+".join(formats),
+                            "resolution": f"{width}x{height}",
+                            "count": count,
+                            "streaming": args.streaming,
+                            "corpus_digest": corpus["digest"],
+                            "input_bytes": corpus["bytes"],
+                            "runs": len(runs),
+                            "pages": pages,
+                            "wall_seconds": round(wall, 4),
+                            "pages_per_second": round(pages / wall, 2) if wall else None,
+                            "input_mb_per_second": round(corpus["bytes"] / 2**20 / wall, 2) if wall else None,
+                            "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+                            "output_bytes": runs[-1]["output_bytes"],
+                        }
+                        results.append(row)
+                        print(f"{target:>9} {row['formats']:>24} {row['resolution']:>10} {count:>6} "
+                              f"{row['wall_seconds']:>8.3f} {row['pages_per_second']:>8} "
+                              f"{row['input_mb_per_second']:>7} {row['peak_rss_mb']:>12} "
+                              f"{row['output_bytes'] / 2**20:>10.1f}")
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_root, ignore_errors=True)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "environment": environment(),
+            "results": results,
+        }, indent=2))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5] == "1")
+    else:
+        main()
@@ -0,0 +1,83 @@
+"""
+Streaming writer memory benchmark
+Measures peak RSS of convert_images_to_pdf for growing page counts, with and
+without the streaming writer, on the same synthetic corpora as
+bench_conversion.py (see synthetic_corpus.py). Each measurement runs in a
+fresh subprocess so that ru_maxrss reflects only that conversion.
+
+Usage:
+    python benchmarks/bench_streaming_memory.py --pages 10 100 1000 10000
+    python benchmarks/bench_streaming_memory.py --pages 1000 --formats jpeg --resolution 512x512
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from synthetic_corpus import FORMATS, make_corpus, parse_resolution
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_conversion(input_dir: str, output_pdf: str, streaming: bool) -> None:
+    """Child process entry point: convert and print peak RSS as JSON."""
+    sys.path.insert(0, str(REPO_ROOT))
+    from pdf_converter_api_teaching_part import convert_images_to_pdf
+
+    result = convert_images_to_pdf(input_dir, output_pdf, streaming=streaming)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "pages": result["images_converted"],
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "output_mb": round(Path(output_pdf).stat().st_size / 2**20, 1),
+    }))
+
+
+def measure(input_dir: Path, streaming: bool) -> dict:
+    with tempfile.TemporaryDirectory() as out_dir:
+        output_pdf = str(Path(out_dir) / "out.pdf")
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", str(input_dir), output_pdf,
+             "1" if streaming else "0"],
+            check=True, capture_output=True, text=True
+        )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Streaming writer memory benchmark")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS),
+                        help="Formats mixed in every corpus")
+    parser.add_argument("--resolution", type=parse_resolution, default=(512, 512),
+                        help="WIDTHxHEIGHT of every image")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'pages':>8} {'mode':>10} {'peak RSS MB':>12} {'output MB':>10}")
+    for count in args.pages:
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            corpus = make_corpus(Path(corpus_dir), count, args.formats, args.resolution, args.seed)
+            for streaming in (False, True):
+                row = measure(Path(corpus_dir), streaming)
+                row["mode"] = "streaming" if streaming else "in-memory"
+                row["corpus_digest"] = corpus["digest"]
+                results.append(row)
+                print(f"{row['pages']:>8} {row['mode']:>10} "
+                      f"{row['peak_rss_mb']:>12} {row['output_mb']:>10}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        run_conversion(sys.argv[2], sys.argv[3], sys.argv[4] == "1")
+    else:
+        main()
@@ -0,0 +1,321 @@
+"""
+HTTP load test
+Starts the API under uvicorn on a local port (or targets a running server with
+--url) and drives /convert, /convert/upload and /health with concurrent async
+clients in a configurable mix. Reports throughput, error rate and p50/p95/p99
+latency per endpoint.
+
+A separate probe requests /health at a fixed interval, first on the idle
+server and then throughout the load. /health does no work, so any latency it
+picks up under load is time the event loop spent blocked or starved, which is
+what decides how many conversions a pod can take before its health checks
+and other requests suffer.
+
+Requires httpx (pip install -r requirements-dev.txt). Payloads are synthetic corpora from
+synthetic_corpus.py.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 16 --duration 30 --mix convert=1 upload=1
+    python benchmarks/load_test.py --server-workers 4 --images 50 --output load.json
+    python benchmarks/load_test.py --url http://10.0.0.5:8000 --corpus-dir /shared/corpus --mix convert=1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("The load test needs httpx: pip install httpx")
+
+from synthetic_corpus import EXTENSIONS, FORMATS, make_corpus, parse_resolution
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+ENDPOINTS = ("convert", "upload", "health")
+
+# Conversions can take far longer than the default client timeout
+REQUEST_TIMEOUT = 600.0
+SERVER_START_TIMEOUT = 60.0
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> dict:
+    """Count, error rate, throughput and latency percentiles (ms) of one endpoint"""
+    values = sorted(latencies)
+    total = len(values) + errors
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(len(values) / seconds, 2) if seconds else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1] if values else None),
+    }
+
+
+def parse_mix(items: List[str]) -> Dict[str, float]:
+    """Parse ['convert=2', 'upload=1'] into request type weights"""
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name}': use one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one endpoint with a positive weight")
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, workers: Optional[int], log_path: Optional[str] = None) -> subprocess.Popen:
+    """Start the API under uvicorn with the result caches disabled, logging to log_path if given"""
+    env = {
+        name: value for name, value in os.environ.items()
+        if name not in ("PDF_CONVERTER_CACHE_DIR", "PDF_CONVERTER_FRAGMENT_CACHE_DIR")
+    }
+    if workers is not None:
+        env["PDF_CONVERTER_WORKERS"] = str(workers)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "pdf_converter_api_teaching_part:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env,
+        stdout=subprocess.DEVNULL if log_path is None else open(log_path, "ab"),
+        stderr=subprocess.STDOUT
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, server: Optional[subprocess.Popen]) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {SERVER_START_TIMEOUT:.0f} s")
+
+
+class LoadTest:
+    """Concurrent clients issuing a weighted mix of requests, plus a /health probe"""
+
+    def __init__(self, client: httpx.AsyncClient, args, corpus_dir: Path, output_dir: Path):
+        self.client = client
+        self.args = args
+        self.corpus_dir = corpus_dir
+        self.output_dir = output_dir
+        self.upload_files = [
+            (path.name, path.read_bytes()) for path in sorted(corpus_dir.iterdir())
+            if path.suffix.lstrip(".") in EXTENSIONS.values()
+        ]
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, int] = dict.fromkeys(ENDPOINTS, 0)
+        self.error_samples: List[str] = []
+        self.sequence = 0
+
+    async def request(self, endpoint: str) -> float:
+        """Issue one request and return its latency in seconds"""
+        started = time.perf_counter()
+        if endpoint == "health":
+            response = await self.client.get("/health")
+        elif endpoint == "convert":
+            self.sequence += 1
+            response = await self.client.post("/convert", json={
+                "input_dir": str(self.corpus_dir),
+                "output_pdf_path": str(self.output_dir / f"load_{self.sequence % self.args.concurrency}.pdf"),
+            })
+        else:
+            files = [("files", (name, data, "application/octet-stream")) for name, data in self.upload_files]
+            response = await self.client.post("/convert/upload", files=files)
+        # Count the full response body, as a client downloading the PDF would
+        await response.aread()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{endpoint}: HTTP {response.status_code} {response.text[:200]}")
+        return time.perf_counter() - started
+
+    async def run_client(self, rng: random.Random, deadline: float, remaining: List[int]) -> None:
+        names = [name for name, weight in self.args.mix.items() if weight > 0]
+        weights = [self.args.mix[name] for name in names]
+        while time.monotonic() < deadline:
+            if remaining[0] == 0:
+                return
+            remaining[0] -= 1
+            endpoint = rng.choices(names, weights)[0]
+            try:
+                self.latencies[endpoint].append(await self.request(endpoint))
+            except Exception as e:
+                self.errors[endpoint] += 1
+                if len(self.error_samples) < 10:
+                    self.error_samples.append(str(e) or type(e).__name__)
+
+    async def probe_health(self, stop: asyncio.Event, latencies: List[float], errors: List[int]) -> None:
+        while not stop.is_set():
+            try:
+                latencies.append(await self.request("health"))
+            except Exception:
+                errors[0] += 1
+            try:
+                await asyncio.wait_for(stop.wait(), self.args.probe_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def probe_idle(self) -> dict:
+        """Measure /health latency on the idle server as the baseline"""
+        latencies, errors = [], [0]
+        stop = asyncio.Event()
+        probe = asyncio.create_task(self.probe_health(stop, latencies, errors))
+        await asyncio.sleep(self.args.idle_seconds)
+        stop.set()
+        await probe
+        return summarize(latencies, errors[0], self.args.idle_seconds)
+
+    async def run(self) -> dict:
+        idle = await self.probe_idle()
+
+        probe_latencies, probe_errors = [], [0]
+        stop = asyncio.Event()
+        probe = asyncio.create_task(self.probe_health(stop, probe_latencies, probe_errors))
+        started = time.monotonic()
+        deadline = started + self.args.duration
+        # Shared request budget; -1 means run until the deadline
+        remaining = [self.args.requests if self.args.requests else -1]
+        await asyncio.gather(*(
+            self.run_client(random.Random(self.args.seed + index), deadline, remaining)
+            for index in range(self.args.concurrency)
+        ))
+        elapsed = time.monotonic() - started
+        stop.set()
+        await probe
+
+        endpoints = {
+            name: summarize(self.latencies[name], self.errors[name], elapsed)
+            for name in ENDPOINTS if self.latencies[name] or self.errors[name]
+        }
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "overall": summarize(all_latencies, sum(self.errors.values()), elapsed),
+            "endpoints": endpoints,
+            "health_idle": idle,
+            "health_under_load": summarize(probe_latencies, probe_errors[0], elapsed),
+            "error_samples": self.error_samples,
+        }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{'':>18} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    rows = list(report["endpoints"].items()) + [
+        ("all", report["overall"]),
+        ("health (idle)", report["health_idle"]),
+        ("health (loaded)", report["health_under_load"]),
+    ]
+    for name, row in rows:
+        print(f"{name:>18} {row['requests']:>9} {row['errors']:>7} {str(row['throughput_rps']):>8} "
+              f"{str(row['p50_ms']):>9} {str(row['p95_ms']):>9} {str(row['p99_ms']):>9} {str(row['max_ms']):>9}")
+    for sample in report["error_samples"]:
+        print(f"error: {sample}")
+
+
+async def main_async(args) -> dict:
+    corpus_dir = Path(args.corpus_dir) if args.corpus_dir else Path(tempfile.mkdtemp(prefix="load-corpus-"))
+    make_corpus(corpus_dir, args.images, args.formats, args.resolution, args.seed)
+    output_dir = Path(tempfile.mkdtemp(prefix="load-output-"))
+
+    server = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = start_server(port, args.server_workers, args.server_log)
+    limits = httpx.Limits(max_connections=args.concurrency + 1, max_keepalive_connections=args.concurrency + 1)
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=REQUEST_TIMEOUT, limits=limits) as client:
+            await wait_until_ready(client, server)
+            report = await LoadTest(client, args, corpus_dir, output_dir).run()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report["config"] = {
+        "url": url,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "requests": args.requests,
+        "mix": args.mix,
+        "images": args.images,
+        "formats": args.formats,
+        "resolution": f"{args.resolution[0]}x{args.resolution[1]}",
+        "server_workers": args.server_workers,
+        "seed": args.seed,
+    }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="HTTP load test for the converter API")
+    parser.add_argument("--url", help="Test a running server instead of starting one")
+    parser.add_argument("--server-workers", type=int, help="PDF_CONVERTER_WORKERS for the started server")
+    parser.add_argument("--server-log", help="Append the started server's output to this file")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests (within --duration)")
+    parser.add_argument("--mix", nargs="+", default=["convert=1", "upload=1"],
+                        help="Request types and weights, e.g. convert=2 upload=1 health=1")
+    parser.add_argument("--images", type=int, default=20, help="Images per conversion")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--resolution", type=parse_resolution, default=(1654, 2339), help="WIDTHxHEIGHT")
+    parser.add_argument("--corpus-dir", help="Corpus folder; must be readable by the server for /convert")
+    parser.add_argument("--probe-interval", type=float, default=0.1, help="Seconds between /health probes")
+    parser.add_argument("--idle-seconds", type=float, default=2.0, help="Idle /health baseline before the load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+    try:
+        args.mix = parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
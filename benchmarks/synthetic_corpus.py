@@ -0,0 +1,158 @@
+"""
+Synthetic image corpus generator
+Writes deterministic image folders for benchmarking: a mix of JPEG, PNG, BMP,
+TIFF and GIF files at a given resolution. The same arguments always produce
+byte-identical files for a given Pillow version, so results from different
+runs and machines describe the same input.
+
+Each format is encoded from a handful of seeded templates that are reused
+round-robin, so generating 10,000 pages takes seconds rather than dominating
+the benchmark. Templates are smooth, photo-like textures (upscaled noise)
+rather than raw noise, which would make every encoder hit its worst case.
+
+Usage:
+    python benchmarks/synthetic_corpus.py /tmp/corpus --count 1000 --formats jpeg png --resolution 1654x2339
+"""
+
+import argparse
+import hashlib
+import json
+import random
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from PIL import Image
+
+FORMATS = ("jpeg", "png", "bmp", "tiff", "gif")
+EXTENSIONS = {"jpeg": "jpg", "png": "png", "bmp": "bmp", "tiff": "tiff", "gif": "gif"}
+
+# Distinct encoded images per format; pages cycle through them
+TEMPLATES_PER_FORMAT = 4
+# Noise is drawn at 1/TEXTURE_SCALE of the resolution and upscaled
+TEXTURE_SCALE = 16
+
+MANIFEST_NAME = "corpus.json"
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    """Parse 'WIDTHxHEIGHT' into a (width, height) tuple"""
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height)
+
+
+def _texture(rng: random.Random, size: Tuple[int, int]) -> Image.Image:
+    width, height = size
+    small = (max(1, width // TEXTURE_SCALE), max(1, height // TEXTURE_SCALE))
+    noise = Image.frombytes("RGB", small, rng.randbytes(small[0] * small[1] * 3))
+    return noise.resize(size, Image.BILINEAR)
+
+
+def encode_template(image_format: str, image: Image.Image) -> bytes:
+    """
+    Encode one template the way such files typically arrive.
+
+    JPEGs are photos (quality 90), PNGs and BMPs are lossless RGB, TIFFs are
+    single-strip CCITT Group 4 fax pages and GIFs are palette images.
+    """
+    buffer = BytesIO()
+    if image_format == "jpeg":
+        image.save(buffer, format="JPEG", quality=90)
+    elif image_format == "png":
+        image.save(buffer, format="PNG")
+    elif image_format == "bmp":
+        image.save(buffer, format="BMP")
+    elif image_format == "tiff":
+        bilevel = image.convert("L").point(lambda value: 255 if value > 128 else 0).convert("1")
+        bilevel.save(buffer, format="TIFF", compression="group4", dpi=(200, 200), strip_size=2**30)
+    elif image_format == "gif":
+        image.quantize(colors=64).save(buffer, format="GIF")
+    else:
+        raise ValueError(f"Unknown format '{image_format}': use one of {', '.join(FORMATS)}")
+    return buffer.getvalue()
+
+
+def make_templates(
+    formats: Sequence[str],
+    resolution: Tuple[int, int],
+    seed: int = 0
+) -> Dict[str, List[bytes]]:
+    """Encode the seeded templates for every format"""
+    templates = {}
+    for image_format in formats:
+        # One stream per format, so adding a format does not change the others
+        rng = random.Random(f"{seed}:{image_format}:{resolution[0]}x{resolution[1]}")
+        templates[image_format] = [
+            encode_template(image_format, _texture(rng, resolution)) for _ in range(TEMPLATES_PER_FORMAT)
+        ]
+    return templates
+
+
+def make_corpus(
+    directory: Path,
+    count: int,
+    formats: Sequence[str] = FORMATS,
+    resolution: Tuple[int, int] = (1654, 2339),
+    seed: int = 0
+) -> dict:
+    """
+    Write a deterministic corpus of `count` images, cycling through `formats`.
+
+    A manifest next to the images records the parameters, the total size and
+    a digest of the contents. If the directory already holds a corpus with
+    the same parameters, it is reused as is.
+
+    Args:
+        directory: Folder to write the images to
+        count: Number of images (pages)
+        formats: Formats to mix, in page order
+        resolution: (width, height) of every image in pixels
+        seed: Seed for the image contents
+
+    Returns:
+        The manifest: parameters, 'bytes' and 'digest'
+    """
+    params = {"count": count, "formats": list(formats), "resolution": list(resolution), "seed": seed}
+    manifest_path = directory / MANIFEST_NAME
+    try:
+        manifest = json.loads(manifest_path.read_text())
+        if manifest["params"] == params:
+            return manifest
+    except (OSError, ValueError, KeyError):
+        pass
+
+    directory.mkdir(parents=True, exist_ok=True)
+    for stale in directory.iterdir():
+        if stale.is_file():
+            stale.unlink()
+
+    templates = make_templates(formats, resolution, seed)
+    digest = hashlib.sha256()
+    total_bytes = 0
+    for idx in range(count):
+        image_format = formats[idx % len(formats)]
+        data = templates[image_format][(idx // len(formats)) % TEMPLATES_PER_FORMAT]
+        (directory / f"page_{idx:05d}.{EXTENSIONS[image_format]}").write_bytes(data)
+        digest.update(data)
+        total_bytes += len(data)
+
+    manifest = {"params": params, "bytes": total_bytes, "digest": digest.hexdigest()}
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic image corpus")
+    parser.add_argument("directory", help="Folder to write the images to")
+    parser.add_argument("--count", type=int, default=100, help="Number of images")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--resolution", type=parse_resolution, default=(1654, 2339), help="WIDTHxHEIGHT")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    manifest = make_corpus(Path(args.directory), args.count, args.formats, args.resolution, args.seed)
+    print(f"{args.count} images, {manifest['bytes'] / 2**20:.1f} MB, sha256 {manifest['digest'][:16]}")
+
+
+if __name__ == "__main__":
+    main()
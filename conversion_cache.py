@@ -0,0 +1,411 @@
+"""
+Conversion Caches
+On-disk, byte-budgeted caches with least-recently-used eviction.
+PdfResultCache stores whole converted PDFs keyed by a hash of the ordered
+image contents plus the conversion options. FragmentCache stores the prepared
+page data of single images so they can be reused across different PDFs.
+"""
+
+import enum
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+import img2pdf
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Fragment cache entries: this magic, a 4-byte big-endian header length, a JSON
+# header describing the frames, then the frames' byte strings back to back.
+# Entries are parsed, never unpickled, so a writable cache directory does not
+# let anyone run code in the server.
+FRAMES_MAGIC = b"PDFFRAMES1\n"
+# The only enums frames may contain, by name
+FRAME_ENUMS = {cls.__name__: cls for cls in (img2pdf.Colorspace, img2pdf.ImageFormat, img2pdf.Rotation)}
+
+# Stores between re-reading the directory of a cache shared by several processes
+SHARED_RESYNC_INTERVAL = 64
+
+
+class DiskLRUCache:
+    """
+    Key/value store of files in one directory with a total byte budget.
+
+    Recency is tracked in memory and mirrored to the files' mtimes, so the
+    LRU order survives a restart. All methods are thread-safe. A shared cache
+    is used by several processes at once; it periodically re-reads the
+    directory so the byte budget covers entries written by the others.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        max_bytes: int,
+        suffix: str = "",
+        shared: bool = False
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.shared = shared
+        # Suffixes of small files stored next to an entry and removed with it
+        self.companion_suffixes: tuple = ()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._stores_since_sync = 0
+        self._load()
+
+    def _load(self) -> None:
+        """Index the files already in the cache directory, oldest first."""
+        self._entries.clear()
+        self._total_bytes = 0
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.suffix) and not entry.name.startswith("."):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:len(entry.name) - len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def path_for(self, key: str) -> Path:
+        """Return the path a cache entry is stored at"""
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Look up an entry and mark it as recently used.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Path of the cached file, or None on a miss
+        """
+        with self._lock:
+            if key not in self._entries and self.shared:
+                # Possibly written by another process since the last resync
+                try:
+                    self._entries[key] = self.path_for(key).stat().st_size
+                    self._total_bytes += self._entries[key]
+                except FileNotFoundError:
+                    pass
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Removed behind our back; forget about it
+            with self._lock:
+                self._forget(key)
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return path
+
+    def put_file(self, key: str, source: Union[str, Path]) -> bool:
+        """Copy a file into the cache; returns False if it is larger than the whole budget."""
+        return self._store(key, lambda tmp: shutil.copyfile(source, tmp))
+
+    def put_bytes(self, key: str, data: bytes) -> bool:
+        """Store bytes in the cache; returns False if they are larger than the whole budget."""
+        return self._store(key, lambda tmp: Path(tmp).write_bytes(data))
+
+    def _store(self, key: str, write) -> bool:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        os.close(fd)
+        try:
+            write(tmp)
+            size = os.path.getsize(tmp)
+            if size > self.max_bytes:
+                os.unlink(tmp)
+                return False
+            os.replace(tmp, self.path_for(key))
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        with self._lock:
+            self._stores_since_sync += 1
+            if self.shared and self._stores_since_sync >= SHARED_RESYNC_INTERVAL:
+                self._stores_since_sync = 0
+                self._load()
+            self._forget(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+        return True
+
+    def _forget(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the budget is met."""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            for path in [self.path_for(key)] + [self.directory / f"{key}{suffix}" for suffix in self.companion_suffixes]:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        """Return hit, miss and eviction counters plus current usage"""
+        with self._lock:
+            if self.shared:
+                self._load()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class PdfResultCache(DiskLRUCache):
+    """
+    Cache of whole converted PDFs.
+
+    A PDF can be stored with a small JSON metadata file describing the
+    conversion (e.g. how many images were converted or skipped), so a hit
+    reports the same result as the conversion that produced it.
+    """
+
+    METADATA_SUFFIX = ".json"
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int):
+        super().__init__(directory, max_bytes, suffix=".pdf")
+        self.companion_suffixes = (self.METADATA_SUFFIX,)
+
+    def put_file(self, key: str, source: Union[str, Path], metadata: Optional[dict] = None) -> bool:
+        """
+        Copy a PDF into the cache.
+
+        Args:
+            key: Cache key
+            source: PDF file to copy
+            metadata: JSON-serializable description of the conversion,
+                written before the PDF so a hit always finds it, and removed
+                again if the PDF is not stored
+
+        Returns:
+            False if the PDF is larger than the whole budget and was not stored
+        """
+        if metadata is None:
+            return super().put_file(key, source)
+        metadata_path = self.directory / f"{key}{self.METADATA_SUFFIX}"
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp, metadata_path)
+        stored = False
+        try:
+            stored = super().put_file(key, source)
+        finally:
+            if not stored:
+                # No entry would ever evict it
+                try:
+                    os.unlink(metadata_path)
+                except FileNotFoundError:
+                    pass
+        return stored
+
+    def get_metadata(self, key: str) -> Optional[dict]:
+        """Return the metadata stored with an entry, or None if there is none"""
+        try:
+            return json.loads((self.directory / f"{key}{self.METADATA_SUFFIX}").read_text())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def key_for(images: Iterable[Union[bytes, Path]], options: dict) -> str:
+        """
+        Compute the cache key for an ordered set of images.
+
+        Args:
+            images: Image contents or paths of image files, in page order
+            options: Conversion options that affect the output
+
+        Returns:
+            Hex digest identifying the conversion
+        """
+        key = hashlib.sha256()
+        key.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        for image in images:
+            key.update(b"\0" + file_digest(image))
+        return key.hexdigest()
+
+
+class FragmentCache(DiskLRUCache):
+    """
+    Cache of prepared per-image page data, keyed by image content hash.
+
+    An entry holds the frames img2pdf.read_images() produced for one image:
+    the encoded image XObject stream plus its dimensions, colorspace and
+    resolution, which is everything needed to lay out and write its pages.
+    Entries are stored in a plain data format (see FRAMES_MAGIC); entries
+    that do not parse, such as pickles from older versions, are misses.
+    """
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int):
+        super().__init__(directory, max_bytes, suffix=".frames", shared=True)
+
+    def get_frames(self, key: str) -> Optional[List[tuple]]:
+        """
+        Load the prepared frames of an image.
+
+        Args:
+            key: Hex digest of the image contents
+
+        Returns:
+            List of frame tuples, or None on a miss
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return decode_frames(f.read())
+        except (OSError, ValueError):
+            # Evicted by another process or partially written; treat as a miss
+            with self._lock:
+                self._forget(key)
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put_frames(self, key: str, frames: List[tuple]) -> None:
+        """Store the prepared frames of an image."""
+        self.put_bytes(key, encode_frames(frames))
+
+
+def encode_frames(frames: List[tuple]) -> bytes:
+    """
+    Serialize prepared frames for the fragment cache.
+
+    Args:
+        frames: Frame tuples of None, bools, numbers, strings, byte strings,
+            img2pdf enums and nested lists and tuples of these
+
+    Returns:
+        The entry's contents
+
+    Raises:
+        TypeError: If a frame holds any other type
+    """
+    blobs: List[bytes] = []
+
+    def encode(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            blobs.append(bytes(value))
+            return {"bytes": len(blobs) - 1}
+        if isinstance(value, enum.Enum):
+            if FRAME_ENUMS.get(type(value).__name__) is not type(value):
+                raise TypeError(f"Cannot store {type(value).__name__} in the fragment cache")
+            return {"enum": type(value).__name__, "name": value.name}
+        if isinstance(value, tuple):
+            return {"tuple": [encode(item) for item in value]}
+        if isinstance(value, list):
+            return [encode(item) for item in value]
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        raise TypeError(f"Cannot store {type(value).__name__} in the fragment cache")
+
+    header = json.dumps({
+        "frames": [encode(frame) for frame in frames],
+        "sizes": [len(blob) for blob in blobs],
+    }).encode("utf-8")
+    return b"".join([FRAMES_MAGIC, struct.pack(">I", len(header)), header] + blobs)
+
+
+def decode_frames(data: bytes) -> List[tuple]:
+    """
+    Parse a fragment cache entry written by encode_frames().
+
+    Args:
+        data: The entry's contents
+
+    Returns:
+        List of frame tuples
+
+    Raises:
+        ValueError: If the entry is malformed or truncated
+    """
+    if not data.startswith(FRAMES_MAGIC):
+        raise ValueError("Not a fragment cache entry")
+
+    def decode(value):
+        if isinstance(value, list):
+            return [decode(item) for item in value]
+        if isinstance(value, dict):
+            if "bytes" in value:
+                return blobs[value["bytes"]]
+            if "tuple" in value:
+                return tuple(decode(item) for item in value["tuple"])
+            if "enum" in value:
+                return FRAME_ENUMS[value["enum"]][value["name"]]
+            raise ValueError(f"Unknown value in fragment cache entry: {value}")
+        return value
+
+    try:
+        offset = len(FRAMES_MAGIC)
+        (header_length,) = struct.unpack_from(">I", data, offset)
+        offset += 4
+        header = json.loads(data[offset:offset + header_length])
+        offset += header_length
+        blobs = []
+        for size in header["sizes"]:
+            blobs.append(data[offset:offset + size])
+            offset += size
+        if offset != len(data):
+            raise ValueError("Truncated fragment cache entry")
+        return [decode(frame) for frame in header["frames"]]
+    except (KeyError, IndexError, TypeError, struct.error) as e:
+        raise ValueError(f"Malformed fragment cache entry: {str(e)}")
+
+
+def file_digest(image: Union[bytes, Path]) -> bytes:
+    """
+    Hash image contents given as bytes or as a file path.
+
+    Args:
+        image: Image contents or path of an image file
+
+    Returns:
+        SHA-256 digest
+    """
+    if not isinstance(image, Path):
+        return hashlib.sha256(image).digest()
+    digest = hashlib.sha256()
+    with open(image, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.digest()
@@ -0,0 +1,333 @@
+"""
+Conversion Jobs
+In-memory queue of asynchronous conversion jobs. Submitting a job returns its
+ID immediately; a bounded pool of asyncio worker tasks runs queued jobs and
+clients poll for their status and progress. Batches run many conversions with
+a concurrency limit and report a result per item.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class ConversionJob:
+    """State of one submitted job, updated as it moves through the queue"""
+
+    def __init__(self, request: Any):
+        self.job_id = uuid.uuid4().hex
+        self.request = request
+        self.status = JOB_QUEUED
+        self.pages_done = 0
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job has completed, successfully or not"""
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self) -> dict:
+        """Return the job's public status"""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class ConversionBatch:
+    """
+    Many conversions submitted together, run with a concurrency limit.
+
+    Items are started in order but finish in any order; each result records
+    the index of the item it belongs to.
+    """
+
+    def __init__(self, requests: List[Any], concurrency: int = 1):
+        self.batch_id = uuid.uuid4().hex
+        self.requests = requests
+        self.concurrency = max(1, concurrency)
+        self.status = JOB_QUEUED
+        self.results: List[Optional[dict]] = [None] * len(requests)
+        self.items_done = 0
+        self.items_failed = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether every item has completed"""
+        return self.status == JOB_DONE
+
+    async def run(self, runner: Callable[[Any], Awaitable[dict]]) -> AsyncIterator[dict]:
+        """
+        Run every item and yield item results as they complete.
+
+        Stopping the iteration early cancels the items that have not finished.
+
+        Args:
+            runner: Coroutine function converting one request
+
+        Yields:
+            Item results with index, status and result or error
+        """
+        self.status = JOB_RUNNING
+        self.started_at = time.time()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def run_item(index: int, request: Any) -> None:
+            async with semaphore:
+                item = {"index": index, "status": JOB_DONE, "result": None, "error": None}
+                try:
+                    item["result"] = await runner(request)
+                except Exception as e:
+                    item["status"] = JOB_FAILED
+                    item["error"] = str(e)
+            await finished.put(item)
+
+        tasks = [
+            asyncio.create_task(run_item(index, request))
+            for index, request in enumerate(self.requests)
+        ]
+        try:
+            for _ in range(len(tasks)):
+                item = await finished.get()
+                self.results[item["index"]] = item
+                if item["status"] == JOB_DONE:
+                    self.items_done += 1
+                else:
+                    self.items_failed += 1
+                yield item
+            self.status = JOB_DONE
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.finished_at = time.time()
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        """Return the batch's public status, with the results finished so far"""
+        status = {
+            "batch_id": self.batch_id,
+            "status": self.status,
+            "items_total": len(self.requests),
+            "items_done": self.items_done,
+            "items_failed": self.items_failed,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_results:
+            status["results"] = [item for item in self.results if item is not None]
+        return status
+
+
+class JobManager:
+    """
+    Runs submitted jobs on a fixed number of asyncio worker tasks.
+
+    The queue is bounded so a flood of submissions cannot grow memory without
+    limit, and only the most recent finished jobs are kept for polling.
+    Progress reported by conversion workers, possibly in other processes,
+    arrives as (job_id, pages_done) tuples on a queue followed by a thread.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[ConversionJob], Awaitable[dict]],
+        workers: int = 1,
+        max_queued: int = 10000,
+        max_finished: int = 10000
+    ):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, ConversionJob]" = OrderedDict()
+        self._finished_ids: "OrderedDict[str, None]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._batches: "OrderedDict[str, ConversionBatch]" = OrderedDict()
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._progress_queue = None
+        self._progress_thread: Optional[threading.Thread] = None
+
+    async def start(self, progress_queue=None) -> None:
+        """
+        Start the worker tasks and, optionally, the progress follower.
+
+        Args:
+            progress_queue: Queue receiving (job_id, pages_done) tuples
+        """
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        if progress_queue is not None:
+            self._progress_queue = progress_queue
+            self._progress_thread = threading.Thread(
+                target=self._follow_progress, name="job-progress", daemon=True
+            )
+            self._progress_thread.start()
+        logger.info(f"Started job queue with {self.workers} workers (capacity {self.max_queued})")
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks and running batches; queued jobs are dropped."""
+        tasks = self._tasks + list(self._batch_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        if self._progress_thread is not None:
+            self._progress_queue.put(None)
+            self._progress_thread.join(timeout=5)
+            self._progress_thread = None
+
+    def submit(self, request: Any) -> ConversionJob:
+        """
+        Queue a job.
+
+        Args:
+            request: Request passed to the runner
+
+        Returns:
+            The queued job
+
+        Raises:
+            JobQueueFullError: If the queue is at capacity
+        """
+        if self._queue is None:
+            raise RuntimeError("The job queue has not been started")
+        job = ConversionJob(request)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+        self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[ConversionJob]:
+        """Look up a job by ID"""
+        return self._jobs.get(job_id)
+
+    def submit_batch(
+        self,
+        requests: List[Any],
+        runner: Callable[[Any], Awaitable[dict]],
+        concurrency: int = 1
+    ) -> ConversionBatch:
+        """
+        Start a batch in the background so its results can be polled.
+
+        Args:
+            requests: Requests passed to the runner, one per item
+            runner: Coroutine function converting one request
+            concurrency: Maximum number of items converted at the same time
+
+        Returns:
+            The started batch
+        """
+        batch = ConversionBatch(requests, concurrency)
+        self._batches[batch.batch_id] = batch
+        while len(self._batches) > self.max_finished:
+            oldest_id = next(iter(self._batches))
+            if not self._batches[oldest_id].finished:
+                break
+            del self._batches[oldest_id]
+
+        async def consume() -> None:
+            async for _ in batch.run(runner):
+                pass
+            logger.info(
+                f"Batch {batch.batch_id} finished: {batch.items_done} done, "
+                f"{batch.items_failed} failed"
+            )
+
+        task = asyncio.create_task(consume())
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[ConversionBatch]:
+        """Look up a batch by ID"""
+        return self._batches.get(batch_id)
+
+    def update_progress(self, job_id: str, pages_done: int) -> None:
+        """Record the number of pages a running job has written"""
+        job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.pages_done = pages_done
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of known jobs in each state"""
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for job in list(self._jobs.values()):
+            counts[job.status] += 1
+        return counts
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = await self.runner(job)
+                job.status = JOB_DONE
+            except asyncio.CancelledError:
+                job.status = JOB_FAILED
+                job.error = "Job cancelled by server shutdown"
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = JOB_FAILED
+            finally:
+                job.finished_at = time.time()
+                self._finished(job)
+                self._queue.task_done()
+
+    def _finished(self, job: ConversionJob) -> None:
+        """Remember a finished job, forgetting the oldest beyond the history limit."""
+        self._finished_ids[job.job_id] = None
+        while len(self._finished_ids) > self.max_finished:
+            old_id, _ = self._finished_ids.popitem(last=False)
+            self._jobs.pop(old_id, None)
+
+    def _follow_progress(self) -> None:
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                return
+            job_id, pages_done = item
+            self.update_progress(job_id, pages_done)
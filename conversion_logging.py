@@ -0,0 +1,327 @@
+"""
+Conversion Logging
+Non-blocking, structured logging. A handler on the root logger only puts
+records on a bounded in-memory queue; a background listener thread formats
+them and writes them to stderr (and optionally a file), so a request never
+waits on log I/O. Records are written as JSON lines carrying the ID of the
+request that logged them, and high-rate levels can be sampled.
+
+Usage:
+    configure_logging(level="INFO", log_format="json", sample_rates={logging.DEBUG: 0.01})
+    app.add_middleware(RequestIdMiddleware)
+"""
+
+import atexit
+import contextvars
+import copy
+import itertools
+import json
+import logging
+import queue
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, List, Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+LOG_FORMATS = ("json", "text")
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Client-supplied request IDs are kept only if they look like an ID
+_VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+
+# LogRecord attributes; anything else on a record was passed with `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {
+    "message", "asctime", "request_id", "sample_rate", "taskName"
+}
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Set by configure_logging
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+_listener: Optional["DrainingQueueListener"] = None
+
+
+def current_request_id() -> Optional[str]:
+    """Return the ID of the request being handled, if any"""
+    return _request_id.get()
+
+
+def new_request_id() -> str:
+    """Generate a request ID"""
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def request_id_context(request_id: Optional[str]) -> Iterator[None]:
+    """Attribute records logged in the enclosed block to a request ID"""
+    token = _request_id.set(request_id)
+    try:
+        yield
+    finally:
+        _request_id.reset(token)
+
+
+def call_with_request_id(request_id: Optional[str], func, /, *args, **kwargs):
+    """
+    Call a function with a request ID bound.
+
+    Context variables do not cross into pool workers or executor threads;
+    submit this in place of `func` to keep their records attributed.
+
+    Args:
+        request_id: Request ID to bind while func runs
+        func: Function to call
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The function's return value
+    """
+    with request_id_context(request_id):
+        return func(*args, **kwargs)
+
+
+def parse_sample_rates(spec: Optional[str]) -> Dict[int, float]:
+    """
+    Parse per-level sampling rates, e.g. 'DEBUG=0.01,INFO=0.5'.
+
+    Args:
+        spec: Comma-separated LEVEL=RATE pairs, rates between 0 and 1
+
+    Returns:
+        Mapping of level number to the fraction of records kept
+
+    Raises:
+        ValueError: If a level or rate is invalid
+    """
+    rates = {}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        name, _, rate = part.partition("=")
+        level = logging.getLevelName(name.strip().upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level '{name.strip()}' in sample rates '{spec}'")
+        rates[level] = float(rate)
+        if not 0 <= rates[level] <= 1:
+            raise ValueError(f"Sample rate for {name.strip()} must be between 0 and 1, got {rate}")
+    return rates
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp every record with the current request ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class LevelSampler(logging.Filter):
+    """
+    Keep one in every N records of a sampled level.
+
+    A rate of 0.01 keeps every 100th record; kept records carry the rate
+    as `sample_rate` so counts can be scaled back up. Sampling counts
+    records rather than drawing random numbers, so a burst is thinned
+    evenly. Levels without a rate are never sampled.
+    """
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        # 0 drops the level entirely
+        self.every = {level: round(1 / rate) if rate else 0 for level, rate in rates.items() if rate < 1}
+        self._seen = {level: itertools.count() for level in self.every}
+        self.dropped = dict.fromkeys(self.every, 0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = self.every.get(record.levelno)
+        if every is None:
+            return True
+        if every == 0 or next(self._seen[record.levelno]) % every:
+            self.dropped[record.levelno] += 1
+            return False
+        record.sample_rate = 1 / every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line.
+
+    Fields: time (UTC, ISO 8601), level, logger, message, request_id and
+    process, plus sample_rate for sampled levels, every field passed with
+    `extra` (e.g. stage_timings_ms) and the traceback as exception.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "process": record.process,
+        }
+        if hasattr(record, "sample_rate"):
+            entry["sample_rate"] = record.sample_rate
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks the logging thread.
+
+    Records are put on the queue without waiting; when the queue is full
+    the record is dropped and counted instead. Only the message and any
+    traceback are rendered here; formatting happens on the listener.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._traceback_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames alive; keep the text only
+            record.exc_text = self._traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """Queue listener whose stop() waits for room rather than failing on a full queue"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def configure_logging(
+    level: str = "INFO",
+    log_format: str = "json",
+    log_file: Optional[str] = None,
+    sample_rates: Optional[Dict[int, float]] = None,
+    queue_size: int = 10000
+) -> bool:
+    """
+    Route the root logger through a queue and a background listener.
+
+    Like logging.basicConfig, this does nothing if the root logger already
+    has handlers, and it only configures logging once per process.
+
+    Args:
+        level: Root log level name
+        log_format: 'json' for JSON lines or 'text' for plain lines
+        log_file: Also append records to this file
+        sample_rates: Fraction of records kept per level number
+        queue_size: Records waiting for the listener before new ones are dropped
+
+    Returns:
+        True if logging was configured by this call
+
+    Raises:
+        ValueError: If the log format is unknown
+    """
+    global _queue_handler, _listener
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{log_format}': use one of {', '.join(LOG_FORMATS)}")
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return False
+
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    outputs: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        outputs.append(logging.FileHandler(log_file))
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(max(1, queue_size))
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(RequestIdFilter())
+    if sample_rates:
+        _queue_handler.addFilter(LevelSampler(sample_rates))
+    root.addHandler(_queue_handler)
+    root.setLevel(level.upper())
+
+    _listener = DrainingQueueListener(log_queue, *outputs, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return True
+
+
+def stop_logging() -> None:
+    """Write out every queued record and stop the listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> dict:
+    """Return the records waiting to be written and those dropped by a full queue or sampling"""
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0, "sampled_out": 0}
+    sampled_out = sum(
+        sum(log_filter.dropped.values())
+        for log_filter in _queue_handler.filters if isinstance(log_filter, LevelSampler)
+    )
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "sampled_out": sampled_out,
+    }
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware binding a request ID to every HTTP request.
+
+    The ID is taken from the request's X-Request-ID header when it looks
+    like one, otherwise generated, and is returned in the same header.
+    """
+
+    def __init__(self, app, header: str = REQUEST_ID_HEADER):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        supplied = dict(scope["headers"]).get(self.header, b"").decode("latin-1")
+        request_id = supplied if _VALID_REQUEST_ID.fullmatch(supplied) else new_request_id()
+
+        async def send_with_request_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (self.header, request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        with request_id_context(request_id):
+            await self.app(scope, receive, send_with_request_id)
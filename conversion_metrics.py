@@ -0,0 +1,396 @@
+"""
+Conversion Metrics
+Counters, gauges and histograms exposed in the Prometheus text format. Metrics
+are kept in plain dictionaries keyed by label values; recording one costs a
+lock and a dictionary update, so it can sit on every request's hot path.
+Per-conversion stage timings are collected with StageTimings.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Request and conversion latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Upload request sizes, in bytes (64 KiB to 1 GiB)
+SIZE_BUCKETS = tuple(float(4 ** n * 64 * 1024) for n in range(8))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Base class for a metric family with a fixed set of label names"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        """Return the metric's sample lines"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Return the metric in the Prometheus text format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing total, e.g. images converted or errors"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Add to the total for the given label values"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        """Return the current total for the given label values"""
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, e.g. requests in flight.
+
+    A gauge created with `function` has no stored value; the function is
+    called whenever the metrics are rendered.
+    """
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the value for the given label values"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increase the value for the given label values"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        """Decrease the value for the given label values"""
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0.0)]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets, with sum and count"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [count per bucket..., count above the last bucket], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation for the given label values"""
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on the /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric and return it"""
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+class ConversionMetrics:
+    """The converter's metrics, with helpers for recording conversions"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry()
+        register = self.registry.register
+        self.request_seconds = register(Histogram(
+            "pdf_converter_http_request_duration_seconds",
+            "HTTP request latency by endpoint",
+            ("method", "endpoint", "status"),
+        ))
+        self.requests_in_flight = register(Gauge(
+            "pdf_converter_http_requests_in_flight",
+            "HTTP requests being served",
+        ))
+        self.conversion_seconds = register(Histogram(
+            "pdf_converter_conversion_duration_seconds",
+            "Time spent converting, by endpoint",
+            ("endpoint",),
+        ))
+        self.conversions_in_flight = register(Gauge(
+            "pdf_converter_conversions_in_flight",
+            "Conversions running or waiting for a conversion worker",
+        ))
+        self.queue_depth = register(Gauge(
+            "pdf_converter_job_queue_depth",
+            "Asynchronous jobs waiting for a job worker",
+        ))
+        self.images = register(Counter(
+            "pdf_converter_images_converted_total",
+            "Images converted, by endpoint",
+            ("endpoint",),
+        ))
+        self.pages = register(Counter(
+            "pdf_converter_pages_written_total",
+            "PDF pages written, by endpoint",
+            ("endpoint",),
+        ))
+        self.bytes_in = register(Counter(
+            "pdf_converter_input_bytes_total",
+            "Bytes of image data converted, by endpoint",
+            ("endpoint",),
+        ))
+        self.bytes_out = register(Counter(
+            "pdf_converter_output_bytes_total",
+            "Bytes of PDF written, by endpoint",
+            ("endpoint",),
+        ))
+        self.upload_bytes = register(Histogram(
+            "pdf_converter_upload_request_bytes",
+            "Total size of the files in each upload request",
+            buckets=SIZE_BUCKETS,
+        ))
+        self.errors = register(Counter(
+            "pdf_converter_errors_total",
+            "Failed requests and conversions, by endpoint and exception type",
+            ("endpoint", "exception"),
+        ))
+        self.admission_queue_depth = register(Gauge(
+            "pdf_converter_admission_queue_depth",
+            "Conversion requests waiting for admission",
+        ))
+        self.admission_cost = register(Gauge(
+            "pdf_converter_admission_cost_bytes",
+            "Estimated cost, in input bytes, of the conversion requests admitted",
+        ))
+        self.scratch_bytes = register(Gauge(
+            "pdf_converter_scratch_bytes_reserved",
+            "Scratch space reserved by uploads being converted on disk",
+        ))
+        self.log_records_dropped = register(Gauge(
+            "pdf_converter_log_records_dropped",
+            "Log records dropped because the log queue was full",
+        ))
+
+    def record_conversion(self, endpoint: str, result: dict, seconds: float) -> None:
+        """
+        Record a finished conversion.
+
+        Args:
+            endpoint: Endpoint label, e.g. 'convert' or 'upload'
+            result: Conversion result with images_converted and, if known,
+                pages, bytes_in and bytes_out
+            seconds: Time the conversion took
+        """
+        self.conversion_seconds.observe(seconds, endpoint=endpoint)
+        self.images.inc(result.get("images_converted") or 0, endpoint=endpoint)
+        self.pages.inc(result.get("pages") or 0, endpoint=endpoint)
+        self.bytes_in.inc(result.get("bytes_in") or 0, endpoint=endpoint)
+        self.bytes_out.inc(result.get("bytes_out") or 0, endpoint=endpoint)
+
+    def record_error(self, endpoint: str, error: BaseException) -> None:
+        """
+        Count a failure under its exception type.
+
+        Conversions re-raise failures as IOError; the type of the original
+        exception is taken from its `error_type` attribute when set.
+        """
+        exception = getattr(error, "error_type", None) or type(error).__name__
+        self.errors.inc(endpoint=endpoint, exception=exception)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request.
+
+    Requests are labeled with the matched route's path template (e.g.
+    '/jobs/{job_id}'), so the number of series stays bounded.
+    """
+
+    def __init__(self, app, metrics: ConversionMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.requests_in_flight.dec()
+            route = scope.get("route")
+            self.metrics.request_seconds.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                endpoint=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
+
+
+class StageTimings:
+    """
+    Wall-clock time spent in each stage of one conversion.
+
+    Stages are reported in the order they first ran; a stage entered more
+    than once accumulates its time. finish() adds a 'total' stage covering
+    everything since the object was created.
+
+    Usage:
+        timings = StageTimings()
+        with timings.stage("scan"):
+            files = get_image_files(path)
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as part of a stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float) -> None:
+        """Add time to a stage"""
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def update(self, seconds: Optional[Dict[str, float]]) -> None:
+        """Add the stage times collected elsewhere, e.g. by a PDF writer"""
+        for name, value in (seconds or {}).items():
+            self.add(name, value)
+
+    def milliseconds(self) -> Dict[str, float]:
+        """Return the stage times in milliseconds"""
+        return {name: round(value * 1000, 3) for name, value in self.seconds.items()}
+
+    def finish(self) -> Dict[str, float]:
+        """Set the 'total' stage to the time since creation and return all stages in milliseconds"""
+        self.seconds.pop("total", None)
+        self.seconds["total"] = time.perf_counter() - self.started
+        return self.milliseconds()
+
+
+def server_timing_header(timings_ms: Dict[str, float]) -> str:
+    """Format stage timings in milliseconds as a Server-Timing header value"""
+    return ", ".join(f"{name};dur={value}" for name, value in timings_ms.items())
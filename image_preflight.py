@@ -0,0 +1,130 @@
+"""
+Image Preflight
+Cheap validation of image files before any encoding starts. Only the header
+(via Pillow's lazy Image.open) and, where the format has a fixed trailer, the
+last few bytes of each file are read, so a bad file in a large folder is found
+in milliseconds instead of after the images before it have been encoded.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+PREFLIGHT_REJECT = "reject"
+PREFLIGHT_SKIP = "skip"
+PREFLIGHT_POLICIES = (PREFLIGHT_REJECT, PREFLIGHT_SKIP)
+
+# Pillow format expected for each supported extension
+EXTENSION_FORMATS = {
+    ".png": "PNG",
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".bmp": "BMP",
+    ".tiff": "TIFF",
+    ".tif": "TIFF",
+    ".gif": "GIF",
+}
+
+# Pillow modes img2pdf can embed; 16-bit grayscale is only handled for PNG
+SUPPORTED_MODES = {"1", "L", "LA", "P", "PA", "RGB", "RGBA", "CMYK"}
+PNG_ONLY_MODES = {"I", "I;16", "I;16B"}
+
+# Bytes every complete file of these formats ends with
+PNG_TRAILER = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+JPEG_TRAILER = b"\xff\xd9"
+GIF_TRAILER = b"\x3b"
+
+# Encoders sometimes pad JPEG files after the end-of-image marker
+JPEG_TRAILER_SEARCH_BYTES = 1024
+
+
+class ImagePreflightError(ValueError):
+    """Raised when preflight finds images that cannot be converted"""
+
+    def __init__(self, problems: List[Tuple[Path, str]]):
+        self.problems = problems
+        shown = "; ".join(f"{path.name}: {reason}" for path, reason in problems[:5])
+        more = f" (and {len(problems) - 5} more)" if len(problems) > 5 else ""
+        super().__init__(f"{len(problems)} invalid images: {shown}{more}")
+
+
+def _check_trailer(f, image_format: str, file_size: int) -> Optional[str]:
+    """Check that a file ends the way a complete file of its format must."""
+    if image_format == "PNG":
+        f.seek(max(0, file_size - len(PNG_TRAILER)))
+        if f.read() != PNG_TRAILER:
+            return "truncated PNG (no IEND chunk)"
+    elif image_format == "JPEG":
+        f.seek(max(0, file_size - JPEG_TRAILER_SEARCH_BYTES))
+        if JPEG_TRAILER not in f.read():
+            return "truncated JPEG (no end-of-image marker)"
+    elif image_format == "GIF":
+        f.seek(file_size - 1)
+        if f.read(1) != GIF_TRAILER:
+            return "truncated GIF (no trailer)"
+    elif image_format == "BMP":
+        f.seek(2)
+        declared_size = int.from_bytes(f.read(4), "little")
+        if declared_size > file_size:
+            return f"truncated BMP ({file_size} of {declared_size} bytes)"
+    return None
+
+
+def check_image(path: Union[str, Path]) -> Optional[str]:
+    """
+    Validate one image from its header and trailer without decoding it.
+
+    Args:
+        path: Path of the image file
+
+    Returns:
+        Description of the problem, or None if the image looks convertible
+    """
+    path = Path(path)
+    expected_format = EXTENSION_FORMATS.get(path.suffix.lower())
+    try:
+        with open(path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size == 0:
+                return "empty file"
+            with Image.open(f) as img:
+                image_format, mode, (width, height) = img.format, img.mode, img.size
+            if expected_format is not None and image_format != expected_format:
+                return f"{image_format} data in a {path.suffix} file"
+            if width <= 0 or height <= 0:
+                return f"invalid dimensions {width}x{height}"
+            if mode not in SUPPORTED_MODES and not (image_format == "PNG" and mode in PNG_ONLY_MODES):
+                return f"unsupported colorspace {mode}"
+            return _check_trailer(f, image_format, file_size)
+    except UnidentifiedImageError:
+        return "not a recognized image"
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return f"unreadable header: {str(e)}"
+
+
+def preflight_images(
+    image_paths: List[Path],
+    max_threads: Optional[int] = None
+) -> List[Tuple[Path, str]]:
+    """
+    Validate image headers in parallel threads.
+
+    Args:
+        image_paths: Paths of the images
+        max_threads: Number of threads reading headers (default: Python's
+            ThreadPoolExecutor default)
+
+    Returns:
+        List of (path, problem) tuples for invalid images, in input order
+    """
+    if not image_paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="preflight") as pool:
+        problems = list(pool.map(check_image, image_paths))
+    return [(path, problem) for path, problem in zip(image_paths, problems) if problem is not None]
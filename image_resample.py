@@ -0,0 +1,175 @@
+"""
+Image Resampling
+Optional normalization stage that caps the resolution of oversized images
+before they are embedded in a PDF. Images over the pixel or DPI limit are
+downscaled and re-encoded; the DPI written with them is scaled by the same
+factor, so each page keeps its physical size and only loses resolution.
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# img2pdf lays out images without DPI metadata at this resolution
+DEFAULT_DPI = 96.0
+DEFAULT_JPEG_QUALITY = 85
+
+# Pillow shrinks by an integer factor first (box filter) and only applies the
+# Lanczos filter to the last step, which is much faster for large reductions
+REDUCING_GAP = 3.0
+
+# Photographic modes are re-encoded as JPEG; palette and alpha images as
+# lossless PNG. Other modes (bilevel, 16-bit) are left untouched.
+JPEG_MODES = {"L", "RGB", "CMYK"}
+PNG_MODES = {"LA", "RGBA", "P", "PA"}
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def resample_options(
+    max_dimension: Optional[int] = None,
+    target_dpi: Optional[float] = None,
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY
+) -> Optional[dict]:
+    """
+    Collect resampling settings, or return None when no limit is set.
+
+    Raises:
+        ValueError: If a setting is out of range
+    """
+    if max_dimension is None and target_dpi is None:
+        return None
+    if max_dimension is not None and max_dimension < 1:
+        raise ValueError("max_dimension must be at least 1 pixel")
+    if target_dpi is not None and target_dpi <= 0:
+        raise ValueError("target_dpi must be positive")
+    if not 1 <= jpeg_quality <= 100:
+        raise ValueError("jpeg_quality must be between 1 and 100")
+    return {"max_dimension": max_dimension, "target_dpi": target_dpi, "jpeg_quality": jpeg_quality}
+
+
+def _scale_factor(
+    size: Tuple[int, int],
+    dpi: Tuple[float, float],
+    max_dimension: Optional[int],
+    target_dpi: Optional[float]
+) -> float:
+    scale = 1.0
+    if max_dimension is not None:
+        scale = min(scale, max_dimension / max(size))
+    if target_dpi is not None:
+        scale = min(scale, target_dpi / max(dpi))
+    return scale
+
+
+def resample_image(
+    rawdata: bytes,
+    max_dimension: Optional[int] = None,
+    target_dpi: Optional[float] = None,
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY
+) -> bytes:
+    """
+    Downscale one encoded image if it exceeds the limits.
+
+    Images within the limits, multi-frame images, bilevel and 16-bit images
+    are returned unchanged. Grayscale, RGB and CMYK images are re-encoded as
+    JPEG; palette images and images with transparency as PNG. EXIF
+    orientation is applied to the pixels and the ICC profile is kept.
+
+    Args:
+        rawdata: Encoded image file contents
+        max_dimension: Maximum width or height in pixels
+        target_dpi: Maximum resolution, from the image's DPI metadata or
+            img2pdf's default of 96 DPI
+        jpeg_quality: Quality of re-encoded JPEG images (1-100)
+
+    Returns:
+        Encoded image file contents
+    """
+    with Image.open(BytesIO(rawdata)) as img:
+        lossless = img.mode in PNG_MODES or "transparency" in img.info
+        if getattr(img, "n_frames", 1) > 1 or img.mode not in JPEG_MODES | PNG_MODES:
+            return rawdata
+
+        dpi = tuple(float(d) or DEFAULT_DPI for d in img.info.get("dpi", (DEFAULT_DPI, DEFAULT_DPI)))
+        scale = _scale_factor(img.size, dpi, max_dimension, target_dpi)
+        if scale >= 1.0:
+            return rawdata
+
+        # JPEG stores whole-number DPI, so round the new resolution down and
+        # derive the pixel size from it; the page size then stays the same
+        new_dpi = tuple(max(1, int(d * scale)) for d in dpi)
+        width, height = img.size
+        new_size = (
+            max(1, min(round(width * new_dpi[0] / dpi[0]), int(width * scale))),
+            max(1, min(round(height * new_dpi[1] / dpi[1]), int(height * scale))),
+        )
+        icc_profile = img.info.get("icc_profile")
+        orientation = img.getexif().get(0x0112, 1)
+
+        if lossless:
+            # Palette images are resampled in full color, not nearest-neighbor
+            has_alpha = img.mode in {"LA", "PA", "RGBA"} or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+        else:
+            # For JPEG, let the decoder scale by 1/2, 1/4 or 1/8 in the DCT domain
+            img.draft(img.mode, new_size)
+        resized = img.resize(new_size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+
+    resized = ImageOps.exif_transpose(resized)
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        new_dpi = (new_dpi[1], new_dpi[0])
+
+    buffer = BytesIO()
+    if lossless:
+        resized.save(buffer, format="PNG", dpi=new_dpi, icc_profile=icc_profile)
+    else:
+        resized.save(buffer, format="JPEG", quality=jpeg_quality, dpi=new_dpi, icc_profile=icc_profile)
+    return buffer.getvalue()
+
+
+def resample_images(
+    images: Iterable[Union[str, Path, bytes]],
+    max_dimension: Optional[int] = None,
+    target_dpi: Optional[float] = None,
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+    max_threads: int = 4
+) -> Iterator[bytes]:
+    """
+    Resample images in parallel threads, yielding them in input order.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so threads
+    use several cores. Only a small window of images runs ahead of the
+    consumer, which keeps memory bounded for long image lists.
+
+    Args:
+        images: Paths of the images or their contents, in page order
+        max_dimension: Maximum width or height in pixels
+        target_dpi: Maximum resolution in DPI
+        jpeg_quality: Quality of re-encoded JPEG images (1-100)
+        max_threads: Number of resampling threads
+
+    Yields:
+        Encoded image file contents
+    """
+    def load_and_resample(image) -> bytes:
+        rawdata = image if isinstance(image, bytes) else Path(image).read_bytes()
+        return resample_image(rawdata, max_dimension, target_dpi, jpeg_quality)
+
+    window = max(1, max_threads) * 2
+    with ThreadPoolExecutor(max_workers=max(1, max_threads), thread_name_prefix="resample") as pool:
+        pending = deque()
+        for image in images:
+            pending.append(pool.submit(load_and_resample, image))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,205 @@
+"""
+Memory Profile
+Opt-in per-conversion memory instrumentation. A conversion wrapped with
+profile_memory reports the peak of Python allocations traced by tracemalloc
+and how much the process's resident set grew, and MemoryLeaderboard keeps the
+most memory-hungry recent conversions for inspection.
+
+tracemalloc only sees allocations made through Python's allocator; pixel
+buffers decoded by Pillow are allocated in C and only show up in the RSS
+figures. Tracing slows allocation-heavy code down noticeably, so it is only
+switched on for the duration of a profiled conversion.
+"""
+
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ru_maxrss is reported in KiB on Linux and in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+# Conversions profiled at the same time in this process; tracing stops with the last
+_active_lock = threading.Lock()
+_active_profiles = 0
+# Whether this module started tracing (rather than PYTHONTRACEMALLOC or a debugger)
+_owns_tracer = False
+
+# How often the resident set size is sampled during a profiled conversion
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def current_rss() -> int:
+    """Return the resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # No procfs: fall back to the peak, which is never below the current size
+        return max_rss()
+
+
+def max_rss() -> int:
+    """Return the peak resident set size of this process so far, in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT
+
+
+class _RssSampler(threading.Thread):
+    """
+    Background thread tracking the highest RSS seen while it runs.
+
+    ru_maxrss only ever grows, so it cannot show the peak of a conversion
+    that stays below an earlier one; sampling catches peaks that last longer
+    than the sampling interval.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self) -> int:
+        """Stop sampling and return the peak RSS in bytes"""
+        self._stopped.set()
+        self.join()
+        return max(self.peak, current_rss())
+
+
+def profile_memory(func, *args, **kwargs) -> dict:
+    """
+    Call a conversion function and add its memory profile to the result.
+
+    Meant to be submitted to the conversion pool in place of `func`. A pool
+    worker runs one conversion at a time, so the figures belong to this
+    conversion alone; conversions profiled concurrently in one process (no
+    pool) share the tracer and see each other's allocations.
+
+    Args:
+        func: Conversion function returning a result dictionary
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The function's result with a "memory_profile" dictionary holding
+        traced_peak_bytes, rss_before_bytes, rss_peak_bytes (highest RSS
+        during the call), rss_delta_bytes (rss_peak_bytes - rss_before_bytes),
+        max_rss_bytes (the process's peak since it started) and the worker pid
+    """
+    global _active_profiles, _owns_tracer
+    with _active_lock:
+        if _active_profiles == 0:
+            _owns_tracer = not tracemalloc.is_tracing()
+            if _owns_tracer:
+                tracemalloc.start()
+        _active_profiles += 1
+    tracemalloc.reset_peak()
+    max_rss_before = max_rss()
+    sampler = _RssSampler()
+    rss_before = sampler.peak
+    sampler.start()
+    try:
+        result = func(*args, **kwargs)
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        rss_peak = sampler.stop()
+        with _active_lock:
+            _active_profiles -= 1
+            if _active_profiles == 0 and _owns_tracer:
+                tracemalloc.stop()
+
+    process_peak = max_rss()
+    if process_peak > max_rss_before:
+        # A new high-water mark was set during the call: that is its exact peak
+        rss_peak = max(rss_peak, process_peak)
+    result["memory_profile"] = {
+        "traced_peak_bytes": traced_peak,
+        "rss_before_bytes": rss_before,
+        "rss_peak_bytes": rss_peak,
+        "rss_delta_bytes": max(rss_peak - rss_before, 0),
+        "max_rss_bytes": process_peak,
+        "pid": os.getpid(),
+    }
+    return result
+
+
+def memory_profile_header(profile: dict) -> str:
+    """Format a memory profile as the value of the X-Memory-Profile response header"""
+    return (
+        f"traced_peak_bytes={profile['traced_peak_bytes']}, "
+        f"rss_delta_bytes={profile['rss_delta_bytes']}, "
+        f"max_rss_bytes={profile['max_rss_bytes']}"
+    )
+
+
+class MemoryLeaderboard:
+    """
+    Rolling top-N of the most memory-hungry conversions.
+
+    Conversions are ranked by the larger of their traced peak and RSS growth.
+    Entries older than `window_seconds` drop out, so the board reflects
+    recent traffic rather than a single spike since startup.
+    """
+
+    def __init__(self, size: int = 20, window_seconds: float = 3600.0):
+        self.size = size
+        self.window_seconds = window_seconds
+        self.profiled = 0
+        self._entries: List[dict] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def footprint(entry: dict) -> int:
+        """Bytes an entry is ranked by"""
+        return max(entry["traced_peak_bytes"], entry["rss_delta_bytes"])
+
+    def record(self, endpoint: str, label: str, profile: dict, result: Optional[dict] = None) -> None:
+        """
+        Add a profiled conversion.
+
+        Args:
+            endpoint: Endpoint that ran the conversion, e.g. 'convert' or 'upload'
+            label: What was converted, e.g. the input directory
+            profile: The "memory_profile" from profile_memory
+            result: The conversion result, for its image and byte counts
+        """
+        result = result or {}
+        entry = {
+            "endpoint": endpoint,
+            "label": label,
+            "time": time.time(),
+            "images": result.get("images_converted"),
+            "bytes_in": result.get("bytes_in"),
+            **profile,
+        }
+        logger.info(
+            f"Memory profile for {endpoint} '{label}': traced peak {profile['traced_peak_bytes'] / 2**20:.1f} MB, "
+            f"RSS +{profile['rss_delta_bytes'] / 2**20:.1f} MB (max {profile['max_rss_bytes'] / 2**20:.1f} MB)",
+            extra={"memory_profile": profile}
+        )
+        with self._lock:
+            self.profiled += 1
+            self._expire()
+            self._entries.append(entry)
+            self._entries.sort(key=self.footprint, reverse=True)
+            del self._entries[self.size:]
+
+    def top(self) -> List[dict]:
+        """Return the current top entries, largest first"""
+        with self._lock:
+            self._expire()
+            return [dict(entry) for entry in self._entries]
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.window_seconds
+        self._entries = [entry for entry in self._entries if entry["time"] >= cutoff]
@@ -5,32 +5,182 @@ Provides both REST API endpoints and direct function calls.
 """
 
 import os
+import asyncio
+import hashlib
+import json
 import logging
+import multiprocessing
+import threading
+import time
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
 import img2pdf
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from PIL import Image
+from fastapi import FastAPI, Header, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartParser
 from pydantic import BaseModel, Field
 import tempfile
 import shutil
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from admission_control import AdmissionController, AdmissionRejectedError
+from conversion_cache import FragmentCache, PdfResultCache
+from conversion_jobs import ConversionBatch, JobManager, JobQueueFullError
+from conversion_logging import (
+    RequestIdMiddleware, call_with_request_id, configure_logging, current_request_id,
+    logging_stats, parse_sample_rates, request_id_context
+)
+from conversion_metrics import ConversionMetrics, MetricsMiddleware, StageTimings, server_timing_header
+from image_preflight import PREFLIGHT_POLICIES, PREFLIGHT_REJECT, ImagePreflightError, preflight_images
+from image_resample import DEFAULT_JPEG_QUALITY, resample_images, resample_options
+from memory_profile import MemoryLeaderboard, memory_profile_header, profile_memory
+from pdf_stream_writer import ENCODE_PATHS, MULTI_FRAME_SIGNATURES, PageChunkQueue, StreamingPdfWriter, write_images_streaming
+from scratch_space import ScratchLease, ScratchSpace, ScratchSpaceFullError
+
+# Configure logging: records are queued and written by a background thread
+configure_logging(
+    level=os.environ.get("PDF_CONVERTER_LOG_LEVEL", "INFO"),
+    log_format=os.environ.get("PDF_CONVERTER_LOG_FORMAT", "json"),
+    log_file=os.environ.get("PDF_CONVERTER_LOG_FILE") or None,
+    sample_rates=parse_sample_rates(os.environ.get("PDF_CONVERTER_LOG_SAMPLE")),
+    queue_size=int(os.environ.get("PDF_CONVERTER_LOG_QUEUE_SIZE", "10000"))
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the server's background machinery before the first request and
+    stop it, in reverse order, on shutdown.
+    """
+    global result_cache
+    # The conversion pool first, so job workers and requests find it running
+    await asyncio.get_running_loop().run_in_executor(None, conversion_executor.start)
+    await job_manager.start(progress_queue=conversion_executor.progress_queue)
+    await scratch_space.start()
+    if RESULT_CACHE_DIR and result_cache is None:
+        result_cache = await run_in_threadpool(PdfResultCache, RESULT_CACHE_DIR, RESULT_CACHE_BYTES)
+        logger.info(f"Result cache at '{RESULT_CACHE_DIR}' ({result_cache.stats()['entries']} entries)")
+    try:
+        yield
+    finally:
+        await scratch_space.stop()
+        await job_manager.stop()
+        conversion_executor.shutdown()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Image to PDF Converter API",
     description="Convert images to PDF files",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Prometheus metrics, served on /metrics
+metrics = ConversionMetrics()
+metrics.log_records_dropped.function = lambda: logging_stats()["dropped"]
+
 # Supported image formats
 SUPPORTED_FORMATS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.gif'}
+# Formats that may hold many pages; the streaming writer expands them frame by frame
+MULTI_FRAME_FORMATS = {'.tiff', '.tif', '.gif'}
+
+# Conversion executor settings (0 workers runs conversions in a thread instead)
+CONVERSION_WORKERS = int(os.environ.get("PDF_CONVERTER_WORKERS", os.cpu_count() or 1))
+CONVERSION_MAX_TASKS_PER_CHILD = int(os.environ.get("PDF_CONVERTER_MAX_TASKS_PER_CHILD", "100"))
+CONVERSION_WARM_START = os.environ.get("PDF_CONVERTER_WARM_START", "1") == "1"
+
+# Upload limits and chunking
+MAX_UPLOAD_FILE_BYTES = int(os.environ.get("PDF_CONVERTER_MAX_FILE_BYTES", 100 * 1024 * 1024))
+MAX_UPLOAD_REQUEST_BYTES = int(os.environ.get("PDF_CONVERTER_MAX_REQUEST_BYTES", 500 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_QUEUE_CHUNKS = 4
+# Uploads up to this total size are converted in memory instead of on disk
+IN_MEMORY_UPLOAD_BYTES = int(os.environ.get("PDF_CONVERTER_IN_MEMORY_BYTES", 20 * 1024 * 1024))
+
+# Scratch space for uploads converted on disk: root (may be on tmpfs), byte quota,
+# how long a request waits for space before 503, and when abandoned directories are reaped
+SCRATCH_DIR = os.environ.get(
+    "PDF_CONVERTER_SCRATCH_DIR",
+    os.path.join(tempfile.gettempdir(), "pdf_converter_scratch")
+)
+SCRATCH_BYTES = int(os.environ.get("PDF_CONVERTER_SCRATCH_BYTES", 2 * 1024 * 1024 * 1024))
+SCRATCH_WAIT_SECONDS = float(os.environ.get("PDF_CONVERTER_SCRATCH_WAIT", "30"))
+SCRATCH_MAX_AGE_SECONDS = float(os.environ.get("PDF_CONVERTER_SCRATCH_MAX_AGE", "3600"))
+SCRATCH_RETRY_AFTER_SECONDS = 5
+
+# Pages buffered between the encoder thread and a streaming response
+STREAM_QUEUE_PAGES = 4
+# Streamed uploads encoded at the same time, each in a thread of its own
+STREAM_WORKERS = int(os.environ.get("PDF_CONVERTER_STREAM_WORKERS", max(CONVERSION_WORKERS, 1)))
+
+# Persistent per-directory listing index
+DIRECTORY_INDEX_DIR = os.environ.get(
+    "PDF_CONVERTER_INDEX_DIR",
+    os.path.join(tempfile.gettempdir(), "pdf_converter_index")
+)
+
+# Whole-PDF result cache (disabled unless a directory is configured)
+RESULT_CACHE_DIR = os.environ.get("PDF_CONVERTER_CACHE_DIR")
+RESULT_CACHE_BYTES = int(os.environ.get("PDF_CONVERTER_CACHE_BYTES", 1024 * 1024 * 1024))
+# Options recorded in the cache key for uploads, which have no format filter or sort
+UPLOAD_CACHE_OPTIONS = {"image_formats": None, "sort_order": "upload"}
+
+# Per-image fragment cache shared by all conversion workers (disabled unless configured)
+FRAGMENT_CACHE_DIR = os.environ.get("PDF_CONVERTER_FRAGMENT_CACHE_DIR")
+FRAGMENT_CACHE_BYTES = int(os.environ.get("PDF_CONVERTER_FRAGMENT_CACHE_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Header-only validation before encoding: None (off), 'reject' or 'skip'
+PREFLIGHT_POLICY = os.environ.get("PDF_CONVERTER_PREFLIGHT") or None
+PREFLIGHT_THREADS = int(os.environ.get("PDF_CONVERTER_PREFLIGHT_THREADS", min(32, (os.cpu_count() or 1) * 4)))
+
+# Threads resampling oversized images within one conversion
+RESAMPLE_THREADS = int(os.environ.get("PDF_CONVERTER_RESAMPLE_THREADS", os.cpu_count() or 1))
+
+# Memory-map input images instead of reading them (default for requests)
+MEMORY_MAP_INPUT = os.environ.get("PDF_CONVERTER_MEMORY_MAP", "0") == "1"
+
+# Per-image encode reports: default for requests, slowest images named in the log
+REPORT_ENCODING = os.environ.get("PDF_CONVERTER_REPORT_ENCODING", "0") == "1"
+REPORT_SLOWEST_IMAGES = 5
+
+# Per-stage timings (validate, scan, read, encode, write): default for requests
+REPORT_TIMINGS = os.environ.get("PDF_CONVERTER_REPORT_TIMINGS", "0") == "1"
+
+# Memory profiling: every conversion, or only requests sending the header;
+# the most memory-hungry recent conversions are listed on /debug/memory
+MEMORY_PROFILE = os.environ.get("PDF_CONVERTER_MEMORY_PROFILE", "0") == "1"
+MEMORY_PROFILE_HEADER = "X-Memory-Profile"
+MEMORY_PROFILE_TOP = int(os.environ.get("PDF_CONVERTER_MEMORY_PROFILE_TOP", "20"))
+MEMORY_PROFILE_WINDOW = float(os.environ.get("PDF_CONVERTER_MEMORY_PROFILE_WINDOW", "3600"))
+
+# Asynchronous job queue: concurrent jobs, waiting jobs, finished jobs kept for polling
+JOB_WORKERS = int(os.environ.get("PDF_CONVERTER_JOB_WORKERS", max(CONVERSION_WORKERS, 1)))
+JOB_QUEUE_SIZE = int(os.environ.get("PDF_CONVERTER_JOB_QUEUE_SIZE", "10000"))
+JOB_HISTORY_SIZE = int(os.environ.get("PDF_CONVERTER_JOB_HISTORY", "10000"))
+
+# Batch conversions: items converted at the same time per batch, items per batch
+BATCH_CONCURRENCY = int(os.environ.get("PDF_CONVERTER_BATCH_CONCURRENCY", max(CONVERSION_WORKERS, 1)))
+BATCH_MAX_ITEMS = int(os.environ.get("PDF_CONVERTER_BATCH_MAX_ITEMS", "10000"))
+
+# Admission control for /convert and /convert/upload: requests converted at once (0 disables),
+# their total estimated cost in input bytes, requests allowed to wait and for how long
+ADMISSION_CONCURRENCY = int(os.environ.get("PDF_CONVERTER_ADMISSION_CONCURRENCY", 2 * max(CONVERSION_WORKERS, 1)))
+ADMISSION_BYTES = int(os.environ.get("PDF_CONVERTER_ADMISSION_BYTES", 1024 * 1024 * 1024))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("PDF_CONVERTER_ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_WAIT_SECONDS = float(os.environ.get("PDF_CONVERTER_ADMISSION_WAIT", "10"))
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the per-file or per-request byte limit"""
 
 
 class ConversionRequest(BaseModel):
@@ -45,6 +195,58 @@ class ConversionRequest(BaseModel):
         default="name",
         description="Sort order: 'name' or 'modified'"
     )
+    streaming: bool = Field(
+        default=False,
+        description="Write the PDF page by page to keep memory usage flat"
+    )
+    use_index: bool = Field(
+        default=False,
+        description="Reuse the cached directory listing while the directory is unchanged"
+    )
+    append: bool = Field(
+        default=False,
+        description="Only add images that are new since the output PDF was last built"
+    )
+    preflight: Optional[str] = Field(
+        default=PREFLIGHT_POLICY,
+        description="Check image headers before encoding: 'reject' fails on bad files, 'skip' leaves them out"
+    )
+    max_dimension: Optional[int] = Field(
+        default=None,
+        description="Downscale images whose width or height exceeds this many pixels"
+    )
+    target_dpi: Optional[float] = Field(
+        default=None,
+        description="Downscale images above this resolution, keeping their page size"
+    )
+    jpeg_quality: int = Field(
+        default=DEFAULT_JPEG_QUALITY,
+        description="JPEG quality (1-100) for downscaled images"
+    )
+    report_encoding: bool = Field(
+        default=REPORT_ENCODING,
+        description="Report how each image was embedded, its size and encode time"
+    )
+    memory_map: bool = Field(
+        default=MEMORY_MAP_INPUT,
+        description="Memory-map input images instead of reading them into memory"
+    )
+    timings: bool = Field(
+        default=REPORT_TIMINGS,
+        description="Report the time spent in each conversion stage"
+    )
+
+
+class ImageEncodeReport(BaseModel):
+    """How one image was embedded in the PDF"""
+    name: str
+    path: str = Field(
+        ..., description="'jpeg_passthrough', 'png_idat', 'ccitt_passthrough' or 'decode_reencode'"
+    )
+    pages: int
+    bytes_in: int = Field(..., description="Size of the image file")
+    bytes_out: int = Field(..., description="PDF bytes written for the image's pages")
+    encode_ms: float
 
 
 class ConversionResponse(BaseModel):
@@ -53,6 +255,58 @@ class ConversionResponse(BaseModel):
     message: str
     output_path: Optional[str] = None
     images_converted: Optional[int] = None
+    images_skipped: Optional[List[str]] = None
+    encode_paths: Optional[Dict[str, int]] = Field(
+        default=None,
+        description="Number of images embedded through each encode path"
+    )
+    image_reports: Optional[List[ImageEncodeReport]] = None
+    timings: Optional[Dict[str, float]] = Field(
+        default=None,
+        description="Milliseconds spent in each stage: validate, scan, preflight, read, encode, write, total"
+    )
+
+
+class JobStatusResponse(BaseModel):
+    """Status of an asynchronous conversion job"""
+    job_id: str
+    status: str = Field(..., description="'queued', 'running', 'done' or 'failed'")
+    pages_done: int = Field(0, description="Pages written to the PDF so far")
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[ConversionResponse] = None
+    error: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    """Request model for converting many directories in one call"""
+    items: List[ConversionRequest] = Field(..., description="One conversion per directory")
+    max_concurrency: Optional[int] = Field(
+        default=None,
+        description="Items converted at the same time, up to the server limit"
+    )
+
+
+class BatchItemResult(BaseModel):
+    """Outcome of one batch item"""
+    index: int = Field(..., description="Position of the item in the request")
+    status: str = Field(..., description="'done' or 'failed'")
+    result: Optional[ConversionResponse] = None
+    error: Optional[str] = None
+
+
+class BatchStatusResponse(BaseModel):
+    """Status of a batch, with the results of the items finished so far"""
+    batch_id: str
+    status: str = Field(..., description="'queued', 'running' or 'done'")
+    items_total: int
+    items_done: int
+    items_failed: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    results: List[BatchItemResult] = []
 
 
 def validate_directory(directory: str) -> Path:
@@ -76,10 +330,93 @@ def validate_directory(directory: str) -> Path:
     return path
 
 
+def scan_directory(
+    directory: Path,
+    suffixes: Optional[set] = None,
+    with_mtime: bool = True
+) -> List[Tuple[str, float]]:
+    """
+    List regular files in a directory with a single os.scandir pass.
+
+    File types come from the directory entries themselves, and stat() is only
+    called for matching files when modification times are needed.
+
+    Args:
+        directory: Path to the directory
+        suffixes: Lower-case extensions (with dots) to include, or None for all
+        with_mtime: Whether to collect modification times
+
+    Returns:
+        List of (file name, modification time) tuples; the time is 0.0 when
+        with_mtime is False
+    """
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if suffixes is not None and os.path.splitext(entry.name)[1].lower() not in suffixes:
+                continue
+            if entry.is_file():
+                entries.append((entry.name, entry.stat().st_mtime if with_mtime else 0.0))
+    return entries
+
+
+def load_directory_listing(directory: Path) -> List[Tuple[str, float, int]]:
+    """
+    List every regular file in a directory, using the persistent listing index.
+
+    The index stores one listing per directory, tagged with the directory's
+    mtime. It is only rebuilt when that mtime changes, i.e. when files are
+    added, removed or renamed. Rewriting an existing file in place does not
+    change the directory mtime, so 'modified' ordering can lag behind such
+    edits until the next change to the directory itself; the same goes for
+    file sizes.
+
+    Args:
+        directory: Path to the directory
+
+    Returns:
+        List of (file name, modification time, size in bytes) tuples
+    """
+    resolved = str(directory.resolve())
+    index_dir = Path(DIRECTORY_INDEX_DIR)
+    index_path = index_dir / f"{hashlib.sha1(resolved.encode('utf-8')).hexdigest()}.json"
+
+    # Read the directory mtime before scanning, so changes made during the
+    # scan are picked up by the next call
+    dir_mtime_ns = os.stat(directory).st_mtime_ns
+    try:
+        index = json.loads(index_path.read_text())
+        if index["directory"] == resolved and index["mtime_ns"] == dir_mtime_ns:
+            return [(name, mtime, size) for name, mtime, size in index["entries"]]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime, stat.st_size))
+    try:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({
+            "directory": resolved,
+            "mtime_ns": dir_mtime_ns,
+            "entries": entries
+        }))
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        logger.warning(f"Could not update listing index for '{directory}': {str(e)}")
+    return entries
+
+
 def get_image_files(
     directory: Path,
     formats: Optional[List[str]] = None,
-    sort_order: str = "name"
+    sort_order: str = "name",
+    use_index: bool = False,
+    recursive: bool = False
 ) -> List[Path]:
     """
     Get all image files from a directory.
@@ -88,6 +425,10 @@ def get_image_files(
         directory: Path to the directory
         formats: List of image formats to include (without dots)
         sort_order: 'name' or 'modified' for sorting
+        use_index: Reuse the persistent listing index while the directory's
+            mtime is unchanged instead of scanning it again
+        recursive: Include images in subdirectories; with 'name' ordering,
+            files are sorted by their path relative to the directory
 
     Returns:
         List of Path objects for image files
@@ -105,25 +446,195 @@ def get_image_files(
         formats_set = formats_set & SUPPORTED_FORMATS
 
     # Collect image files
-    image_files = []
-    for file_path in directory.iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in formats_set:
-            image_files.append(file_path)
+    if recursive:
+        entries = []
+        for dirpath, _, _ in os.walk(directory):
+            relative = os.path.relpath(dirpath, directory)
+            for name, mtime in scan_directory(Path(dirpath), formats_set, with_mtime=sort_order == "modified"):
+                entries.append((name if relative == "." else os.path.join(relative, name), mtime))
+    elif use_index:
+        entries = [
+            (name, mtime) for name, mtime, _ in load_directory_listing(directory)
+            if os.path.splitext(name)[1].lower() in formats_set
+        ]
+    else:
+        entries = scan_directory(directory, formats_set, with_mtime=sort_order == "modified")
 
     # Sort files
     if sort_order == "modified":
-        image_files.sort(key=lambda p: p.stat().st_mtime)
+        entries.sort(key=lambda entry: entry[1])
     else:  # default to name
-        image_files.sort(key=lambda p: p.name.lower())
+        entries.sort(key=lambda entry: entry[0].lower())
+
+    return [directory / name for name, _ in entries]
+
+
+def append_manifest_path(output_path: Path) -> Path:
+    """Return the path of the manifest kept next to a PDF built in append mode"""
+    return output_path.with_name(output_path.name + ".manifest.json")
+
+
+def load_append_manifest(
+    output_path: Path,
+    input_path: Path,
+    options: dict,
+    files: List[list]
+) -> Optional[dict]:
+    """
+    Load the manifest of an existing output PDF if the new file list extends it.
+
+    Args:
+        output_path: Path of the existing PDF
+        input_path: Directory the images come from
+        options: Conversion options the PDF must have been made with
+        files: [name, size, mtime_ns] for every current image, in page order
+
+    Returns:
+        The manifest, or None if the PDF has to be rebuilt from scratch
+    """
+    try:
+        manifest = json.loads(append_manifest_path(output_path).read_text())
+        pdf_size = output_path.stat().st_size
+    except (OSError, ValueError):
+        return None
+
+    previous_files = manifest.get("files", [])
+    if (
+        manifest.get("input_dir") != str(input_path.resolve())
+        or manifest.get("options") != options
+        or manifest.get("pdf", {}).get("size") != pdf_size
+        or files[:len(previous_files)] != previous_files
+    ):
+        return None
+    return manifest
+
+
+def append_images_to_pdf(
+    input_path: Path,
+    image_files: List[Path],
+    output_path: Path,
+    options: dict,
+    progress: Optional[Callable[[int], None]] = None,
+    resample: Optional[dict] = None,
+    report_images: bool = False,
+    memory_map: bool = False,
+    time_stages: bool = False
+) -> dict:
+    """
+    Bring a PDF up to date with a growing directory by appending new pages.
+
+    A manifest next to the PDF records which files it was made from, their
+    sizes and mtimes, and the writer state. When the current sorted file list
+    starts with exactly those files, only the new ones are written as a PDF
+    incremental update; otherwise the PDF is rebuilt.
+
+    Args:
+        input_path: Directory the images come from
+        image_files: Current image files, in page order
+        output_path: Path of the PDF to create or extend
+        options: Conversion options, recorded in the manifest
+        progress: Called with the number of pages written after each image
+        resample: Resampling settings from resample_options(), if any
+        report_images: Collect encode reports for the images written
+        memory_map: Memory-map image files instead of reading them
+        time_stages: Collect the writer's read, encode and write times
+
+    Returns:
+        Dictionary with the number of images added, whether the PDF was
+        rebuilt, the pages and bytes written, fragment cache counters, image
+        reports and stage times in seconds
+    """
+    files = []
+    for image_file in image_files:
+        stat = image_file.stat()
+        files.append([str(image_file.relative_to(input_path)), stat.st_size, stat.st_mtime_ns])
+
+    manifest = load_append_manifest(output_path, input_path, options, files)
+    cache = get_fragment_cache()
+    evictions_before = cache.evictions if cache is not None else 0
+
+    def load(paths: List[Path]) -> Iterable[Union[Path, bytes]]:
+        if resample is None:
+            return paths
+        return resample_images(paths, **resample, max_threads=RESAMPLE_THREADS)
+
+    if manifest is None:
+        new_files = image_files
+        with open(output_path, "wb") as f:
+            writer = write_images_streaming(
+                load(new_files), f, fragment_cache=cache, progress=progress,
+                report_images=report_images, names=[entry[0] for entry in files], memory_map=memory_map,
+                time_stages=time_stages
+            )
+    else:
+        new_files = image_files[len(manifest["files"]):]
+        if not new_files:
+            return {
+                "images_appended": 0, "rewritten": False, "pages": 0, "bytes_out": 0,
+                "fragment_cache": None, "image_reports": None, "stage_seconds": None
+            }
+        previous_state = manifest["pdf"]
+        names = [entry[0] for entry in files[len(manifest["files"]):]]
+        with open(output_path, "ab") as f:
+            try:
+                with StreamingPdfWriter(
+                    f, fragment_cache=cache, resume=previous_state,
+                    report_images=report_images, memory_map=memory_map, time_stages=time_stages
+                ) as writer:
+                    for name, image in zip(names, load(new_files)):
+                        if isinstance(image, Path):
+                            writer.add_image_file(image, name)
+                        else:
+                            writer.add_image(image, name)
+                        if progress is not None:
+                            progress(writer.page_count - len(previous_state["page_ids"]))
+            except Exception:
+                # Drop the partial update so the PDF stays valid
+                f.truncate(previous_state["size"])
+                raise
+
+    manifest_path = append_manifest_path(output_path)
+    tmp_path = manifest_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps({
+        "input_dir": str(input_path.resolve()),
+        "options": options,
+        "files": files,
+        "pdf": writer.state
+    }))
+    os.replace(tmp_path, manifest_path)
 
-    return image_files
+    return {
+        "images_appended": len(new_files),
+        "rewritten": manifest is None,
+        "pages": writer.page_count - (0 if manifest is None else len(manifest["pdf"]["page_ids"])),
+        "bytes_out": writer.bytes_written - (0 if manifest is None else manifest["pdf"]["size"]),
+        "fragment_cache": {
+            "hits": writer.fragment_hits,
+            "misses": writer.fragment_misses,
+            "evictions": cache.evictions - evictions_before if cache is not None else 0,
+        },
+        "image_reports": writer.image_reports if report_images else None,
+        "stage_seconds": writer.stage_seconds,
+    }
 
 
 def convert_images_to_pdf(
     input_dir: str,
     output_pdf_path: str,
     image_formats: Optional[List[str]] = None,
-    sort_order: str = "name"
+    sort_order: str = "name",
+    streaming: bool = False,
+    use_index: bool = False,
+    append: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+    recursive: bool = False,
+    preflight: Optional[str] = None,
+    max_dimension: Optional[int] = None,
+    target_dpi: Optional[float] = None,
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+    report_encoding: bool = False,
+    memory_map: bool = False,
+    time_stages: bool = False
 ) -> dict:
     """
     Converts all images in a directory to a single PDF file.
@@ -133,30 +644,95 @@ def convert_images_to_pdf(
         output_pdf_path: The path and filename for the output PDF
         image_formats: List of image formats to include (e.g., ['png', 'jpg'])
         sort_order: Sort order: 'name' or 'modified'
+        streaming: Write pages to the output file as they are encoded instead
+            of building the whole PDF in memory first. Always on when the
+            fragment cache is enabled or an image may have several frames
+            (TIFF, GIF).
+        use_index: Reuse the persistent listing index for the input directory
+        append: If the existing output PDF was made from a prefix of the
+            current file list, only add the new images as an incremental update
+        progress: Called with the number of pages written after each image;
+            implies streaming
+        recursive: Include images in subdirectories, ordered by relative path
+        preflight: Validate every image header before encoding anything;
+            'reject' fails the conversion on the first pass if any image is
+            bad, 'skip' leaves bad images out. None disables the check.
+        max_dimension: Downscale images whose width or height exceeds this
+        target_dpi: Downscale images whose resolution exceeds this
+        jpeg_quality: JPEG quality for downscaled images; resampling
+            implies streaming
+        report_encoding: Record the encode path, bytes in and out and encode
+            time of every image and log the slowest; implies streaming
+        memory_map: Memory-map the images instead of reading them, so JPEGs
+            are written to the PDF without being copied; implies streaming
+        time_stages: Time each stage of the conversion and return the times
+            in milliseconds under "timings"
 
     Returns:
-        Dictionary with conversion results
+        Dictionary with conversion results, including the pages and bytes
+        read and written
 
     Raises:
         ValueError: If directory is invalid
-        IOError: If file operations fail
+        IOError: If file operations fail; `error_type` names the original
+            exception
     """
+    timings = StageTimings()
+
+    def finish(result: dict) -> dict:
+        if time_stages:
+            result["timings"] = timings.finish()
+            log_stage_timings(output_pdf_path, result["timings"])
+        return result
+
     try:
+        if preflight is not None and preflight not in PREFLIGHT_POLICIES:
+            raise ValueError(f"Unknown preflight policy '{preflight}': use one of {', '.join(PREFLIGHT_POLICIES)}")
+        resample = resample_options(max_dimension, target_dpi, jpeg_quality)
+
         # Validate input directory
-        input_path = validate_directory(input_dir)
+        with timings.stage("validate"):
+            input_path = validate_directory(input_dir)
 
         # Get image files
-        image_files = get_image_files(input_path, image_formats, sort_order)
+        with timings.stage("scan"):
+            image_files = get_image_files(input_path, image_formats, sort_order, use_index, recursive)
 
         if not image_files:
             formats_str = ', '.join(image_formats) if image_formats else 'all supported formats'
             message = f"No images found in '{input_dir}' with formats: {formats_str}"
             logger.warning(message)
-            return {
+            return finish({
                 "success": False,
                 "message": message,
                 "images_converted": 0
-            }
+            })
+
+        # Check headers before spending CPU time on encoding
+        skipped = None
+        if preflight:
+            with timings.stage("preflight"):
+                problems = preflight_images(image_files, PREFLIGHT_THREADS)
+            logger.info(
+                f"Preflight checked {len(image_files)} images in "
+                f"{timings.seconds['preflight'] * 1000:.1f} ms: {len(problems)} invalid"
+            )
+            if problems and preflight == PREFLIGHT_REJECT:
+                raise ImagePreflightError(problems)
+            bad_files = {path for path, _ in problems}
+            for path, reason in problems:
+                logger.warning(f"Skipping '{path}': {reason}")
+            image_files = [f for f in image_files if f not in bad_files]
+            skipped = [f"{path.relative_to(input_path)}: {reason}" for path, reason in problems]
+            if not image_files:
+                message = f"All {len(problems)} images in '{input_dir}' failed preflight"
+                logger.warning(message)
+                return finish({
+                    "success": False,
+                    "message": message,
+                    "images_converted": 0,
+                    "images_skipped": skipped
+                })
 
         # Convert to PDF
         image_paths = [str(img) for img in image_files]
@@ -165,57 +741,1433 @@ def convert_images_to_pdf(
         # Create output directory if it doesn't exist
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(output_path, "wb") as f:
-            f.write(img2pdf.convert(image_paths))
+        fragment_stats = None
+        image_reports = None
+        names = [str(img.relative_to(input_path)) for img in image_files]
+        if append:
+            options = {
+                "image_formats": image_formats,
+                "sort_order": sort_order,
+                "recursive": recursive,
+                "resample": resample,
+            }
+            appended = append_images_to_pdf(
+                input_path, image_files, output_path, options, progress, resample, report_encoding, memory_map,
+                time_stages
+            )
+            timings.update(appended["stage_seconds"])
+            fragment_stats = appended["fragment_cache"]
+            image_reports = appended["image_reports"]
+            images_converted = appended["images_appended"]
+            pages = appended["pages"]
+            bytes_out = appended["bytes_out"]
+            if appended["rewritten"]:
+                message = f"Successfully converted {images_converted} images to '{output_pdf_path}'"
+            else:
+                message = (
+                    f"Appended {images_converted} new images to '{output_pdf_path}' "
+                    f"({len(image_files)} images total)"
+                )
+        else:
+            use_writer = (
+                resample is not None or streaming or FRAGMENT_CACHE_DIR or progress is not None
+                or report_encoding or memory_map or has_multi_frame_images(image_paths)
+            )
+            with open(output_path, "wb") as f:
+                if use_writer:
+                    images = image_paths
+                    if resample is not None:
+                        images = resample_images(image_paths, **resample, max_threads=RESAMPLE_THREADS)
+                    written = write_pdf_with_fragments(
+                        images, f, progress, report_encoding, names, memory_map, time_stages
+                    )
+                    timings.update(written["stage_seconds"])
+                    fragment_stats = written["fragment_cache"]
+                    image_reports = written["image_reports"]
+                    pages = written["pages"]
+                else:
+                    # Multi-frame formats always take the writer path above
+                    pdf = convert_with_img2pdf(image_paths, timings if time_stages else None)
+                    with timings.stage("write"):
+                        f.write(pdf)
+                    pages = len(image_paths)
+                bytes_out = f.tell()
+            images_converted = len(image_files)
+            message = f"Successfully converted {images_converted} images to '{output_pdf_path}'"
 
-        message = f"Successfully converted {len(image_files)} images to '{output_pdf_path}'"
         logger.info(message)
 
-        return {
+        result = {
             "success": True,
             "message": message,
             "output_path": str(output_path.absolute()),
-            "images_converted": len(image_files)
+            "images_converted": images_converted,
+            "pages": pages,
+            "bytes_in": sum(img.stat().st_size for img in image_files[len(image_files) - images_converted:]),
+            "bytes_out": bytes_out
         }
+        if skipped is not None:
+            result["images_skipped"] = skipped
+        if FRAGMENT_CACHE_DIR:
+            result["fragment_cache"] = fragment_stats
+        if image_reports is not None:
+            log_image_reports(output_pdf_path, image_reports)
+            result["encode_paths"] = summarize_image_reports(image_reports)
+            result["image_reports"] = image_reports
+        return finish(result)
 
     except Exception as e:
         error_message = f"Error during conversion: {str(e)}"
         logger.error(error_message, exc_info=True)
-        raise IOError(error_message) from e
+        error = IOError(error_message)
+        # Kept for error metrics; survives the trip back from a worker process
+        error.error_type = type(e).__name__
+        raise error from e
+
+
+def find_tree_folders(input_root: Path, depth: Optional[int] = None) -> List[Path]:
+    """
+    Find the folders of a directory tree that each become one PDF.
 
+    Args:
+        input_root: Root of the tree
+        depth: If set, every folder exactly this many levels below the root
+            (1 = its immediate subfolders), plus any folder above that level
+            that directly contains supported images, so that none are left
+            out; otherwise every folder that directly contains supported
+            images, i.e. the leaf folders of a typical scan tree
 
-async def save_upload_files(upload_files: List[UploadFile], temp_dir: Path) -> List[Path]:
+    Returns:
+        Folders in walk order
+    """
+    folders = []
+    for dirpath, dirnames, filenames in os.walk(input_root):
+        dirnames.sort()
+        path = Path(dirpath)
+        level = len(path.relative_to(input_root).parts)
+        if depth is not None and level == depth:
+            folders.append(path)
+            # The whole subtree goes into this folder's PDF
+            dirnames.clear()
+        elif any(os.path.splitext(name)[1].lower() in SUPPORTED_FORMATS for name in filenames):
+            folders.append(path)
+    return folders
+
+
+def tree_output_path(input_root: Path, folder: Path, output_root: Path) -> Path:
+    """Return the PDF path mirroring a folder's position below the input root"""
+    relative = folder.relative_to(input_root)
+    if not relative.parts:
+        return output_root / f"{input_root.resolve().name}.pdf"
+    return output_root / relative.parent / f"{relative.name}.pdf"
+
+
+def convert_directory_tree(
+    input_root: str,
+    output_root: str,
+    depth: Optional[int] = None,
+    image_formats: Optional[List[str]] = None,
+    sort_order: str = "name",
+    streaming: bool = False,
+    workers: int = CONVERSION_WORKERS,
+    preflight: Optional[str] = None,
+    max_dimension: Optional[int] = None,
+    target_dpi: Optional[float] = None,
+    jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+    memory_map: bool = False
+) -> dict:
+    """
+    Convert every folder of a directory tree to its own PDF in a mirrored tree.
+
+    Folders are converted in parallel in separate worker processes.
+
+    Args:
+        input_root: Root of the input tree
+        output_root: Root of the output tree; 'a/b' becomes 'a/b.pdf' below it
+        depth: Convert folders at this depth, each including its subfolders,
+            instead of every folder that directly contains images; images in
+            folders above this depth go into a PDF per folder of their own
+        image_formats: List of image formats to include
+        sort_order: Sort order: 'name' or 'modified'
+        streaming: Write each PDF page by page
+        workers: Worker processes, 0 to convert one folder at a time in this process
+        preflight: Header validation policy, 'reject' or 'skip'
+        max_dimension: Downscale images whose width or height exceeds this
+        target_dpi: Downscale images whose resolution exceeds this
+        jpeg_quality: JPEG quality for downscaled images
+        memory_map: Memory-map the images instead of reading them
+
+    Returns:
+        Dictionary with per-folder results and aggregate throughput
+
+    Raises:
+        ValueError: If the input directory is invalid
+    """
+    input_path = validate_directory(input_root)
+    output_path = Path(output_root)
+    folders = find_tree_folders(input_path, depth)
+    logger.info(f"Converting {len(folders)} folders from '{input_root}' with {workers} workers")
+
+    started = time.perf_counter()
+    results = []
+
+    def record(folder: Path, result: dict) -> None:
+        result["input_dir"] = str(folder)
+        if result.get("success"):
+            result["output_bytes"] = Path(result["output_path"]).stat().st_size
+        results.append(result)
+
+    jobs = [
+        (folder, dict(
+            input_dir=str(folder),
+            output_pdf_path=str(tree_output_path(input_path, folder, output_path)),
+            image_formats=image_formats,
+            sort_order=sort_order,
+            streaming=streaming,
+            recursive=depth is not None and len(folder.relative_to(input_path).parts) == depth,
+            preflight=preflight,
+            max_dimension=max_dimension,
+            target_dpi=target_dpi,
+            jpeg_quality=jpeg_quality,
+            memory_map=memory_map
+        ))
+        for folder in folders
+    ]
+    if workers <= 0:
+        for folder, kwargs in jobs:
+            try:
+                record(folder, convert_images_to_pdf(**kwargs))
+            except IOError as e:
+                record(folder, {"success": False, "message": str(e), "images_converted": 0, "error": True})
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = {pool.submit(convert_images_to_pdf, **kwargs): folder for folder, kwargs in jobs}
+            for future in as_completed(futures):
+                try:
+                    record(futures[future], future.result())
+                except (IOError, BrokenProcessPool) as e:
+                    # A dead worker fails the folders still in the pool, not the whole run
+                    if isinstance(e, BrokenProcessPool):
+                        logger.error(f"Conversion of '{futures[future]}' failed: {str(e)}")
+                    record(futures[future], {
+                        "success": False, "message": str(e), "images_converted": 0, "error": True
+                    })
+
+    elapsed = time.perf_counter() - started
+    converted = [r for r in results if r.get("success")]
+    images = sum(r["images_converted"] for r in converted)
+    output_bytes = sum(r["output_bytes"] for r in converted)
+    summary = {
+        "folders": len(folders),
+        "folders_converted": len(converted),
+        "folders_failed": sum(1 for r in results if r.get("error")),
+        "folders_empty": sum(1 for r in results if not r.get("success") and not r.get("error")),
+        "images_converted": images,
+        "output_bytes": output_bytes,
+        "elapsed_seconds": round(elapsed, 3),
+        "images_per_second": round(images / elapsed, 1) if elapsed else 0.0,
+        "folders_per_second": round(len(converted) / elapsed, 2) if elapsed else 0.0,
+        "output_mb_per_second": round(output_bytes / 2**20 / elapsed, 2) if elapsed else 0.0,
+    }
+    logger.info(
+        f"Converted {images} images in {len(converted)}/{len(folders)} folders in "
+        f"{summary['elapsed_seconds']}s ({summary['images_per_second']} images/s, "
+        f"{summary['output_mb_per_second']} MB/s written)"
+    )
+    return {"summary": summary, "results": results}
+
+
+def directory_cache_key(
+    input_dir: str,
+    image_formats: Optional[List[str]] = None,
+    sort_order: str = "name",
+    use_index: bool = False,
+    preflight: Optional[str] = None,
+    resample: Optional[dict] = None
+) -> Optional[str]:
+    """
+    Compute the result cache key for a directory conversion.
+
+    Args:
+        input_dir: The path to the directory containing images
+        image_formats: List of image formats to include
+        sort_order: Sort order: 'name' or 'modified'
+        use_index: Reuse the persistent listing index for the input directory
+        preflight: Header validation policy, which can change the output
+        resample: Resampling settings from resample_options(), if any
+
+    Returns:
+        The cache key, or None if the directory is invalid or empty so that
+        the regular conversion reports the problem
+    """
+    try:
+        input_path = validate_directory(input_dir)
+    except ValueError:
+        return None
+    image_files = get_image_files(input_path, image_formats, sort_order, use_index)
+    if not image_files:
+        return None
+
+    options = {
+        "image_formats": sorted(f.lower().lstrip('.') for f in image_formats) if image_formats else None,
+        "sort_order": sort_order,
+    }
+    if preflight:
+        options["preflight"] = preflight
+    if resample:
+        options["resample"] = resample
+    return PdfResultCache.key_for(image_files, options)
+
+
+_fragment_cache: Optional[FragmentCache] = None
+
+
+def get_fragment_cache() -> Optional[FragmentCache]:
+    """Return this process's handle on the fragment cache, or None if disabled"""
+    global _fragment_cache
+    if FRAGMENT_CACHE_DIR and _fragment_cache is None:
+        _fragment_cache = FragmentCache(FRAGMENT_CACHE_DIR, FRAGMENT_CACHE_BYTES)
+    return _fragment_cache
+
+
+def write_pdf_with_fragments(
+    images: Iterable[Union[str, Path, bytes]],
+    outputstream,
+    progress: Optional[Callable[[int], None]] = None,
+    report_images: bool = False,
+    names: Optional[List[str]] = None,
+    memory_map: bool = False,
+    time_stages: bool = False
+) -> dict:
+    """
+    Write a PDF with the streaming writer, reusing cached per-image fragments.
+
+    Args:
+        images: Paths of the images or their contents, in page order
+        outputstream: Binary file object receiving the PDF
+        progress: Called with the number of pages written after each image
+        report_images: Collect an encode report for every image
+        names: Image names used in the reports
+        memory_map: Memory-map image files instead of reading them
+        time_stages: Collect the writer's read, encode and write times
+
+    Returns:
+        Dictionary with the number of pages written under "pages", fragment
+        cache hits, misses and evictions for this conversion under
+        "fragment_cache", the image reports (or None) under "image_reports"
+        and the stage times in seconds (or None) under "stage_seconds"
+    """
+    cache = get_fragment_cache()
+    evictions_before = cache.evictions if cache is not None else 0
+    writer = write_images_streaming(
+        images, outputstream, fragment_cache=cache, progress=progress,
+        report_images=report_images, names=names, memory_map=memory_map, time_stages=time_stages
+    )
+    return {
+        "pages": writer.page_count,
+        "fragment_cache": {
+            "hits": writer.fragment_hits,
+            "misses": writer.fragment_misses,
+            "evictions": cache.evictions - evictions_before if cache is not None else 0,
+        },
+        "image_reports": writer.image_reports if report_images else None,
+        "stage_seconds": writer.stage_seconds,
+    }
+
+
+def convert_with_img2pdf(
+    images: List[Union[str, bytes]],
+    timings: Optional[StageTimings] = None
+) -> bytes:
+    """
+    Convert images to PDF bytes with a single img2pdf.convert call.
+
+    Args:
+        images: Paths of the images or their contents, in page order
+        timings: If given, the image files are read up front so that reading
+            and encoding are timed as separate stages
+
+    Returns:
+        The PDF document
+    """
+    if timings is None:
+        return img2pdf.convert(images, rotation=img2pdf.Rotation.ifvalid)
+    with timings.stage("read"):
+        images = [image if isinstance(image, bytes) else Path(image).read_bytes() for image in images]
+    with timings.stage("encode"):
+        return img2pdf.convert(images, rotation=img2pdf.Rotation.ifvalid)
+
+
+def has_multi_frame_images(images: List[Union[str, bytes]]) -> bool:
+    """
+    Check whether any image may be a multi-page TIFF or animated GIF.
+
+    Such images are converted with the streaming writer, which writes them
+    one frame at a time instead of preparing every frame up front.
+    """
+    for image in images:
+        if isinstance(image, bytes):
+            if image[:4].startswith(MULTI_FRAME_SIGNATURES):
+                return True
+        elif os.path.splitext(image)[1].lower() in MULTI_FRAME_FORMATS:
+            return True
+    return False
+
+
+def summarize_image_reports(image_reports: List[dict]) -> Dict[str, int]:
+    """Count the images embedded through each encode path"""
+    counts = dict.fromkeys(ENCODE_PATHS, 0)
+    for report in image_reports:
+        counts[report["path"]] += 1
+    return counts
+
+
+def log_image_reports(label: str, image_reports: List[dict]) -> None:
+    """
+    Log every image's encode report at DEBUG and a summary at INFO.
+
+    The summary names the slowest images, which are usually the ones that
+    had to be decoded and compressed again.
+    """
+    for report in image_reports:
+        logger.debug(
+            f"Encoded '{report['name']}' via {report['path']}: {report['bytes_in']} -> "
+            f"{report['bytes_out']} bytes in {report['encode_ms']} ms"
+        )
+    if not image_reports:
+        return
+    counts = ", ".join(f"{path}={count}" for path, count in summarize_image_reports(image_reports).items())
+    slowest = sorted(image_reports, key=lambda report: report["encode_ms"], reverse=True)[:REPORT_SLOWEST_IMAGES]
+    slowest_str = ", ".join(
+        f"{report['name']} ({report['path']}, {report['encode_ms']} ms)" for report in slowest
+    )
+    total_ms = sum(report["encode_ms"] for report in image_reports)
+    logger.info(
+        f"Encode paths for '{label}': {counts}; {total_ms:.1f} ms total; slowest: {slowest_str}"
+    )
+
+
+def log_stage_timings(label: str, timings_ms: Dict[str, float]) -> None:
+    """Log a conversion's stage timings, also as the `stage_timings_ms` record field"""
+    stages = " ".join(f"{name}={value}ms" for name, value in timings_ms.items())
+    logger.info(f"Stage timings for '{label}': {stages}", extra={"stage_timings_ms": timings_ms})
+
+
+def convert_image_files(
+    image_paths: List[str],
+    output_pdf_path: str,
+    resample: Optional[dict] = None,
+    names: Optional[List[str]] = None,
+    time_stages: bool = False
+) -> dict:
+    """
+    Convert a list of image files to a single PDF file.
+
+    Args:
+        image_paths: Paths of the images, in page order
+        output_pdf_path: The path and filename for the output PDF
+        resample: Resampling settings from resample_options(), if any
+        names: Image names; when given, an encode report is collected for
+            every image
+        time_stages: Time reading, encoding and writing
+
+    Returns:
+        Dictionary with the images, pages and bytes converted, fragment cache
+        counters, if the cache is enabled, the image reports, if requested,
+        and the stage times in seconds, if requested
+    """
+    timings = StageTimings()
+    result = {
+        "images_converted": len(image_paths),
+        "bytes_in": sum(os.path.getsize(path) for path in image_paths),
+    }
+    with open(output_pdf_path, "wb") as f:
+        if resample is not None or FRAGMENT_CACHE_DIR or names is not None or has_multi_frame_images(image_paths):
+            images = image_paths
+            if resample is not None:
+                images = resample_images(image_paths, **resample, max_threads=RESAMPLE_THREADS)
+            written = write_pdf_with_fragments(
+                images, f, report_images=names is not None, names=names, time_stages=time_stages
+            )
+            timings.update(written["stage_seconds"])
+            result["pages"] = written["pages"]
+            if FRAGMENT_CACHE_DIR:
+                result["fragment_cache"] = written["fragment_cache"]
+            if names is not None:
+                result["image_reports"] = written["image_reports"]
+        else:
+            pdf = convert_with_img2pdf(image_paths, timings if time_stages else None)
+            with timings.stage("write"):
+                f.write(pdf)
+            result["pages"] = len(image_paths)
+        result["bytes_out"] = f.tell()
+    if time_stages:
+        result["stage_seconds"] = timings.seconds
+    return result
+
+
+def convert_image_data(
+    images: List[bytes],
+    resample: Optional[dict] = None,
+    names: Optional[List[str]] = None,
+    time_stages: bool = False
+) -> dict:
+    """
+    Convert in-memory images to PDF bytes.
+
+    Args:
+        images: Encoded image file contents, in page order
+        resample: Resampling settings from resample_options(), if any
+        names: Image names; when given, an encode report is collected for
+            every image
+        time_stages: Time encoding and writing
+
+    Returns:
+        Dictionary with the PDF document under "pdf", the images, pages and
+        bytes converted, fragment cache counters, if the cache is enabled,
+        the image reports, if requested, and the stage times in seconds, if
+        requested
+    """
+    result = {"images_converted": len(images), "bytes_in": sum(len(image) for image in images)}
+    if resample is None and not FRAGMENT_CACHE_DIR and names is None and not has_multi_frame_images(images):
+        timings = StageTimings() if time_stages else None
+        pdf = convert_with_img2pdf(images, timings)
+        result.update(pdf=pdf, pages=len(images), bytes_out=len(pdf))
+        if time_stages:
+            result["stage_seconds"] = timings.seconds
+        return result
+    if resample is not None:
+        images = resample_images(images, **resample, max_threads=RESAMPLE_THREADS)
+    buffer = BytesIO()
+    written = write_pdf_with_fragments(
+        images, buffer, report_images=names is not None, names=names, time_stages=time_stages
+    )
+    if time_stages:
+        result["stage_seconds"] = written["stage_seconds"]
+    result["pdf"] = buffer.getvalue()
+    result["pages"] = written["pages"]
+    result["bytes_out"] = len(result["pdf"])
+    if FRAGMENT_CACHE_DIR:
+        result["fragment_cache"] = written["fragment_cache"]
+    if names is not None:
+        result["image_reports"] = written["image_reports"]
+    return result
+
+
+# Queue for (job_id, pages_done) progress reports, set in every conversion worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue) -> None:
+    """Pool worker initializer: keep the queue progress reports are sent on"""
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def report_job_progress(job_id: str, pages_done: int) -> None:
+    """Send a job's page count to the main process, wherever the job is running"""
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, pages_done))
+
+
+def _warm_up_worker() -> int:
+    """Load the image codecs in a pool worker so the first request is not slow."""
+    Image.init()
+    return os.getpid()
+
+
+class ConversionExecutor:
+    """
+    Process pool that runs CPU-heavy conversions off the event loop.
+
+    The event loop only awaits the result, so other requests (including
+    /health) keep being served while images are encoded on every core.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = CONVERSION_WORKERS,
+        max_tasks_per_child: Optional[int] = CONVERSION_MAX_TASKS_PER_CHILD,
+        warm_start: bool = CONVERSION_WARM_START
+    ):
+        self.max_workers = max_workers
+        self.max_tasks_per_child = max_tasks_per_child or None
+        self.warm_start = warm_start
+        self.progress_queue = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._restart_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Create the process pool and optionally spawn every worker up front."""
+        # Recycling workers requires a non-fork start method
+        mp_context = multiprocessing.get_context("spawn")
+        if self.progress_queue is None:
+            # Conversions run in this process too when there is no pool
+            self.progress_queue = mp_context.Queue()
+            _init_worker(self.progress_queue)
+        if self._pool is not None or self.max_workers <= 0:
+            return
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp_context,
+            max_tasks_per_child=self.max_tasks_per_child,
+            initializer=_init_worker,
+            initargs=(self.progress_queue,)
+        )
+        logger.info(
+            f"Started conversion pool with {self.max_workers} workers "
+            f"(max tasks per child: {self.max_tasks_per_child})"
+        )
+
+        if self.warm_start:
+            futures = [self._pool.submit(_warm_up_worker) for _ in range(self.max_workers)]
+            pids = {future.result() for future in futures}
+            logger.info(f"Warmed up {len(pids)} conversion workers")
+
+    def shutdown(self) -> None:
+        """Stop the process pool, waiting for running conversions to finish."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def restart(self, broken_pool: ProcessPoolExecutor) -> None:
+        """
+        Replace a pool that is unusable because a worker died (e.g. OOM-killed).
+
+        Every conversion running on the broken pool fails at once, so many
+        callers may ask for the same restart; only the first one replaces it.
+
+        Args:
+            broken_pool: The pool the failed conversion was submitted to
+        """
+        with self._restart_lock:
+            if self._pool is not broken_pool:
+                return
+            logger.error("A conversion worker terminated abruptly; restarting the conversion pool")
+            broken_pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self.start()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a picklable function in the pool and await its result.
+
+        If a worker dies while the function runs, the pool is restarted for
+        later calls and the failure is raised rather than retried: every
+        conversion running on the pool fails at once and the one that killed
+        the worker cannot be told apart, so a retry could run it again and
+        take the new pool down too. Callers decide whether to resubmit.
+
+        Args:
+            func: Module-level function to call
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            The function's return value
+
+        Raises:
+            BrokenProcessPool: If a worker died while the function ran
+        """
+        if self._pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            return await loop.run_in_executor(pool, partial(func, *args, **kwargs))
+        except BrokenProcessPool:
+            if pool is not None:
+                await loop.run_in_executor(None, self.restart, pool)
+            raise
+
+
+conversion_executor = ConversionExecutor()
+# Streamed uploads encode in this process rather than the conversion pool, so
+# they get their own bounded threads instead of the default executor
+stream_executor = ThreadPoolExecutor(max_workers=max(STREAM_WORKERS, 1), thread_name_prefix="pdf-stream")
+# Created on first use by get_stream_slots(), inside the server's event loop
+stream_slots: Optional[asyncio.Semaphore] = None
+result_cache: Optional[PdfResultCache] = None
+memory_leaderboard = MemoryLeaderboard(MEMORY_PROFILE_TOP, MEMORY_PROFILE_WINDOW)
+scratch_space = ScratchSpace(SCRATCH_DIR, SCRATCH_BYTES, SCRATCH_WAIT_SECONDS, SCRATCH_MAX_AGE_SECONDS)
+metrics.scratch_bytes.function = lambda: scratch_space.used_bytes
+admission = AdmissionController(ADMISSION_CONCURRENCY, ADMISSION_BYTES, ADMISSION_QUEUE_SIZE, ADMISSION_WAIT_SECONDS)
+metrics.admission_queue_depth.function = lambda: admission.queue_depth
+metrics.admission_cost.function = lambda: admission.in_flight_cost
+
+# Fragment cache counters summed over every conversion worker
+fragment_cache_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def record_fragment_stats(result: dict) -> None:
+    """Add the fragment cache counters of one conversion to the totals"""
+    for name, value in (result.get("fragment_cache") or {}).items():
+        fragment_cache_counters[name] += value
+
+
+def memory_profile_requested(header_value: Optional[str]) -> bool:
+    """Whether a request should be memory-profiled, from its X-Memory-Profile header"""
+    return MEMORY_PROFILE or (header_value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+async def run_conversion(endpoint: str, func, *args, profile_label: Optional[str] = None, **kwargs) -> dict:
+    """
+    Run a conversion in the conversion pool and record its metrics.
+
+    Args:
+        endpoint: Endpoint label for the metrics
+        func: Conversion function returning a result dictionary
+        *args: Positional arguments for func
+        profile_label: If set, profile the conversion's memory use, add it
+            to the result under "memory_profile" and to the leaderboard
+            under this label
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        The conversion result
+    """
+    metrics.conversions_in_flight.inc()
+    started = time.perf_counter()
+    request_id = current_request_id()
+    try:
+        if profile_label is None:
+            result = await conversion_executor.run(call_with_request_id, request_id, func, *args, **kwargs)
+        else:
+            result = await conversion_executor.run(
+                call_with_request_id, request_id, profile_memory, func, *args, **kwargs
+            )
+    finally:
+        metrics.conversions_in_flight.dec()
+    metrics.record_conversion(endpoint, result, time.perf_counter() - started)
+    if profile_label is not None:
+        memory_leaderboard.record(endpoint, profile_label, result["memory_profile"], result)
+    return result
+
+
+async def run_directory_conversion(
+    request: ConversionRequest,
+    job_id: Optional[str] = None,
+    endpoint: str = "convert",
+    profile: bool = MEMORY_PROFILE
+) -> dict:
+    """
+    Convert a directory in the conversion pool, going through the result cache.
+
+    Args:
+        request: ConversionRequest describing the conversion
+        job_id: Job to report page progress for, if any
+        endpoint: Endpoint label for the metrics
+        profile: Profile the conversion's memory use (not for cached results)
+
+    Returns:
+        Dictionary with conversion results; with request.timings, "total" in
+        the stage timings is measured here and so also covers the cache lookup
+        and the wait for a conversion worker
+
+    Raises:
+        ValueError: If the request is invalid
+        IOError: If the conversion fails
+    """
+    timings = StageTimings()
+    resample = resample_options(request.max_dimension, request.target_dpi, request.jpeg_quality)
+    cache_key = None
+    # A cached PDF carries no encode report, so reports always convert
+    if result_cache is not None and not request.append and not request.report_encoding:
+        with timings.stage("cache"):
+            cache_key = await run_in_threadpool(
+                directory_cache_key,
+                request.input_dir,
+                request.image_formats,
+                request.sort_order,
+                request.use_index,
+                request.preflight,
+                resample
+            )
+    if cache_key is not None:
+        cached_pdf = await run_in_threadpool(result_cache.get, cache_key)
+        # Entries without metadata (e.g. from an older version) are converted again
+        cached = await run_in_threadpool(result_cache.get_metadata, cache_key) if cached_pdf is not None else None
+        output_path = Path(request.output_pdf_path)
+        if cached is not None:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                with timings.stage("write"):
+                    await run_in_threadpool(shutil.copyfile, cached_pdf, output_path)
+            except FileNotFoundError:
+                # Evicted since the lookup; convert instead
+                cached = None
+        if cached is not None:
+            message = (
+                f"Successfully converted {cached['images_converted']} images to "
+                f"'{request.output_pdf_path}' (cached)"
+            )
+            logger.info(message)
+            result = {
+                "success": True,
+                "message": message,
+                "output_path": str(output_path.absolute()),
+                "images_converted": cached["images_converted"]
+            }
+            if cached.get("images_skipped"):
+                result["images_skipped"] = cached["images_skipped"]
+            if job_id:
+                # Nothing was converted, so no worker reported progress; report the cached page count
+                job_manager.update_progress(job_id, cached.get("pages", cached["images_converted"]))
+            if request.timings:
+                result["timings"] = timings.finish()
+                log_stage_timings(request.output_pdf_path, result["timings"])
+            return result
+
+    result = await run_conversion(
+        endpoint,
+        convert_images_to_pdf,
+        profile_label=request.input_dir if profile else None,
+        input_dir=request.input_dir,
+        output_pdf_path=request.output_pdf_path,
+        image_formats=request.image_formats,
+        sort_order=request.sort_order,
+        streaming=request.streaming,
+        use_index=request.use_index,
+        append=request.append,
+        preflight=request.preflight,
+        max_dimension=request.max_dimension,
+        target_dpi=request.target_dpi,
+        jpeg_quality=request.jpeg_quality,
+        report_encoding=request.report_encoding,
+        memory_map=request.memory_map,
+        time_stages=request.timings,
+        progress=partial(report_job_progress, job_id) if job_id else None
+    )
+    if result.get("timings") is not None:
+        timings.update({name: value / 1000 for name, value in result["timings"].items() if name != "total"})
+        result["timings"] = timings.finish()
+    record_fragment_stats(result)
+    if cache_key is not None and result["success"]:
+        await run_in_threadpool(
+            result_cache.put_file, cache_key, result["output_path"],
+            {
+                "images_converted": result["images_converted"],
+                "images_skipped": result.get("images_skipped"),
+                "pages": result.get("pages", result["images_converted"])
+            }
+        )
+    return result
+
+
+async def run_conversion_job(job) -> dict:
+    """Job runner: convert the job's directory and return a ConversionResponse dict"""
+    try:
+        # Jobs outlive the request that submitted them; their records carry the job ID
+        with request_id_context(job.job_id):
+            result = await run_directory_conversion(job.request, job_id=job.job_id, endpoint="jobs")
+    except Exception as e:
+        metrics.record_error("jobs", e)
+        raise
+    return ConversionResponse(**result).model_dump()
+
+
+async def run_batch_item(request: ConversionRequest) -> dict:
+    """Batch runner: convert one directory and return a ConversionResponse dict"""
+    try:
+        result = await run_directory_conversion(request, endpoint="batch")
+    except Exception as e:
+        metrics.record_error("batch", e)
+        raise
+    return ConversionResponse(**result).model_dump()
+
+
+async def stream_batch_results(batch: ConversionBatch) -> AsyncIterator[bytes]:
+    """
+    Run a batch and yield one JSON line per item as it finishes.
+
+    Yields:
+        Newline-delimited JSON: a BatchItemResult per item, then the batch
+        status without results
+    """
+    async for item in batch.run(run_batch_item):
+        yield (json.dumps(item) + "\n").encode("utf-8")
+    yield (json.dumps(batch.to_dict(include_results=False)) + "\n").encode("utf-8")
+
+
+job_manager = JobManager(
+    run_conversion_job,
+    workers=JOB_WORKERS,
+    max_queued=JOB_QUEUE_SIZE,
+    max_finished=JOB_HISTORY_SIZE
+)
+metrics.queue_depth.function = lambda: job_manager.queue_depth
+
+
+def validate_upload_extension(upload_file: UploadFile) -> str:
+    """
+    Validate that an uploaded file has a supported image extension.
+
+    Args:
+        upload_file: Uploaded file
+
+    Returns:
+        Lower-case file extension
+
+    Raises:
+        ValueError: If the extension is not supported
+    """
+    file_ext = Path(upload_file.filename).suffix.lower()
+    if file_ext not in SUPPORTED_FORMATS:
+        raise ValueError(
+            f"Unsupported format: {file_ext}. "
+            f"Supported formats: {', '.join(SUPPORTED_FORMATS)}"
+        )
+    return file_ext
+
+
+def check_upload_sizes(
+    upload_files: List[UploadFile],
+    max_file_bytes: int = MAX_UPLOAD_FILE_BYTES,
+    max_request_bytes: int = MAX_UPLOAD_REQUEST_BYTES
+) -> None:
+    """
+    Reject uploads whose sizes, as reported by the multipart parser, are too large.
+
+    Args:
+        upload_files: List of uploaded files
+        max_file_bytes: Maximum size of a single uploaded file
+        max_request_bytes: Maximum total size of all uploaded files
+
+    Raises:
+        UploadTooLargeError: If a byte limit is exceeded
+    """
+    known_sizes = [f.size for f in upload_files if f.size is not None]
+    if any(size > max_file_bytes for size in known_sizes):
+        raise UploadTooLargeError(f"Uploaded file exceeds the limit of {max_file_bytes} bytes")
+    if sum(known_sizes) > max_request_bytes:
+        raise UploadTooLargeError(f"Upload exceeds the limit of {max_request_bytes} bytes")
+
+
+def fits_in_memory(upload_files: List[UploadFile], threshold: int = IN_MEMORY_UPLOAD_BYTES) -> bool:
+    """
+    Check whether an upload is small enough to be converted without touching disk.
+
+    Args:
+        upload_files: List of uploaded files
+        threshold: Maximum total upload size for in-memory conversion
+
+    Returns:
+        True if every file size is known and the total is within the threshold
+    """
+    if any(f.size is None for f in upload_files):
+        return False
+    return sum(f.size for f in upload_files) <= threshold
+
+
+async def read_upload_files(
+    upload_files: List[UploadFile],
+    max_file_bytes: int = MAX_UPLOAD_FILE_BYTES,
+    max_request_bytes: int = MAX_UPLOAD_REQUEST_BYTES
+) -> List[bytes]:
+    """
+    Read uploaded files into memory.
+
+    Args:
+        upload_files: List of uploaded files
+        max_file_bytes: Maximum size of a single uploaded file
+        max_request_bytes: Maximum total size of all uploaded files
+
+    Returns:
+        List of file contents, in upload order
+
+    Raises:
+        ValueError: If a file has an unsupported format
+        UploadTooLargeError: If a byte limit is exceeded
+    """
+    for upload_file in upload_files:
+        validate_upload_extension(upload_file)
+    check_upload_sizes(upload_files, max_file_bytes, max_request_bytes)
+
+    return [await upload_file.read() for upload_file in upload_files]
+
+
+async def copy_upload_file(
+    upload_file: UploadFile,
+    destination: Path,
+    max_file_bytes: int = MAX_UPLOAD_FILE_BYTES,
+    max_bytes: Optional[int] = None
+) -> int:
+    """
+    Copy an uploaded file to disk in chunks without blocking the event loop.
+
+    The request body has already been received by the time the handler
+    runs: Starlette parses the multipart form first and spools every file
+    to its own temporary file. This copies one spooled file into the
+    conversion's directory, reading the next chunk while a worker thread
+    writes the previous one. The byte limits checked here are a backstop;
+    the request limit is enforced while the body is received, by
+    UploadLimitMiddleware.
+
+    Args:
+        upload_file: Uploaded file to copy
+        destination: Path of the file to create
+        max_file_bytes: Maximum size of this file
+        max_bytes: Maximum number of bytes still allowed for the request
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        UploadTooLargeError: If a byte limit is exceeded
+    """
+    limit = max_file_bytes if max_bytes is None else min(max_file_bytes, max_bytes)
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+    write_errors: List[Exception] = []
+
+    async def write_chunks():
+        buffer = await run_in_threadpool(open, destination, "wb")
+        try:
+            while (chunk := await chunks.get()) is not None:
+                # Keep draining after a failure so the reader never blocks
+                if not write_errors:
+                    try:
+                        await run_in_threadpool(buffer.write, chunk)
+                    except Exception as e:
+                        write_errors.append(e)
+        finally:
+            await run_in_threadpool(buffer.close)
+
+    writer = asyncio.create_task(write_chunks())
+    size = 0
+    try:
+        while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > limit:
+                if size > max_file_bytes:
+                    raise UploadTooLargeError(
+                        f"Uploaded file '{upload_file.filename}' exceeds the limit "
+                        f"of {max_file_bytes} bytes"
+                    )
+                raise UploadTooLargeError("Upload exceeds the per-request byte limit")
+            if write_errors:
+                break
+            await chunks.put(chunk)
+    finally:
+        await chunks.put(None)
+        await writer
+
+    if write_errors:
+        raise IOError(f"Error saving '{upload_file.filename}': {write_errors[0]}")
+    return size
+
+
+def upload_scratch_bytes(upload_bytes: int) -> int:
+    """
+    Estimate the disk space an upload uses while it is handled.
+
+    Starlette spools every file part over 1 MiB to the system temp directory
+    while it parses the body. Uploads too large to convert in memory are
+    then copied to a scratch directory, next to an output PDF of about the
+    same size.
+
+    Args:
+        upload_bytes: Size of the request body
+
+    Returns:
+        Bytes to reserve, 0 if nothing is written to disk
+    """
+    if upload_bytes <= MultiPartParser.max_file_size:
+        return 0
+    if upload_bytes <= IN_MEMORY_UPLOAD_BYTES:
+        return upload_bytes
+    return 3 * upload_bytes
+
+
+async def reserve_upload_scratch(scratch_bytes: int) -> ScratchLease:
+    """
+    Reserve scratch space for an upload.
+
+    Args:
+        scratch_bytes: Bytes the upload writes to disk
+
+    Returns:
+        The scratch lease
+
+    Raises:
+        HTTPException: 413 if the upload could never fit in the scratch
+            quota, 503 if no space was released within the wait time
+    """
+    try:
+        if scratch_bytes > scratch_space.quota_bytes:
+            raise UploadTooLargeError(
+                f"Upload needs {scratch_bytes} bytes of scratch space; "
+                f"the quota is {scratch_space.quota_bytes} bytes"
+            )
+        return await scratch_space.reserve(scratch_bytes)
+    except UploadTooLargeError as e:
+        metrics.record_error("upload", e)
+        logger.warning(f"Rejected upload: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except ScratchSpaceFullError as e:
+        metrics.record_error("upload", e)
+        logger.warning(f"Rejected upload: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(SCRATCH_RETRY_AFTER_SECONDS)}
+        )
+
+
+def directory_image_bytes(request: ConversionRequest) -> int:
+    """
+    Estimate the cost of a directory conversion for admission control.
+
+    Sizes come from the persistent listing index, so estimating the same
+    unchanged directory again reads one file instead of listing and
+    statting every image; conversions with use_index reuse the listing
+    refreshed here. Subdirectories are not counted.
+
+    Args:
+        request: ConversionRequest describing the conversion
+
+    Returns:
+        Total size of the images to convert in bytes, 0 if the directory
+        cannot be listed (the conversion then reports the error)
+    """
+    suffixes = SUPPORTED_FORMATS
+    if request.image_formats:
+        suffixes = {f".{fmt.lower().lstrip('.')}" for fmt in request.image_formats} & SUPPORTED_FORMATS
+    try:
+        return sum(
+            size for name, _, size in load_directory_listing(Path(request.input_dir))
+            if os.path.splitext(name)[1].lower() in suffixes
+        )
+    except (OSError, ValueError):
+        return 0
+
+
+def admission_rejected(endpoint: str, e: AdmissionRejectedError) -> HTTPException:
+    """Record a request turned away by admission control and build its 429/503 response"""
+    metrics.record_error(endpoint, e)
+    logger.warning(f"Rejected {endpoint} request: {str(e)}")
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def save_upload_files(
+    upload_files: List[UploadFile],
+    temp_dir: Path,
+    max_file_bytes: int = MAX_UPLOAD_FILE_BYTES,
+    max_request_bytes: int = MAX_UPLOAD_REQUEST_BYTES
+) -> List[Path]:
     """
     Save uploaded files to a temporary directory.
 
     Args:
         upload_files: List of uploaded files
         temp_dir: Temporary directory to save files
+        max_file_bytes: Maximum size of a single uploaded file
+        max_request_bytes: Maximum total size of all uploaded files
 
     Returns:
         List of saved file paths
+
+    Raises:
+        ValueError: If a file has an unsupported format
+        UploadTooLargeError: If a byte limit is exceeded
     """
+    # Validate every extension before copying anything
+    for upload_file in upload_files:
+        validate_upload_extension(upload_file)
+    check_upload_sizes(upload_files, max_file_bytes, max_request_bytes)
+
     saved_files = []
+    total_bytes = 0
     for idx, upload_file in enumerate(upload_files):
-        # Validate file extension
-        file_ext = Path(upload_file.filename).suffix.lower()
-        if file_ext not in SUPPORTED_FORMATS:
-            raise ValueError(
-                f"Unsupported format: {file_ext}. "
-                f"Supported formats: {', '.join(SUPPORTED_FORMATS)}"
+        file_path = temp_dir / f"{idx:03d}_{Path(upload_file.filename).name}"
+        try:
+            total_bytes += await copy_upload_file(
+                upload_file,
+                file_path,
+                max_file_bytes=max_file_bytes,
+                max_bytes=max_request_bytes - total_bytes
             )
-
-        # Save file
-        file_path = temp_dir / f"{idx:03d}_{upload_file.filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
+        except Exception:
+            file_path.unlink(missing_ok=True)
+            raise
         saved_files.append(file_path)
 
     return saved_files
 
 
+def get_stream_slots() -> asyncio.Semaphore:
+    """Return the semaphore limiting concurrent streams, creating it on first use"""
+    global stream_slots
+    if stream_slots is None:
+        stream_slots = asyncio.Semaphore(max(STREAM_WORKERS, 1))
+    return stream_slots
+
+
+async def stream_pdf_chunks(
+    images: List[Union[bytes, Path]],
+    resample: Optional[dict] = None,
+    names: Optional[List[str]] = None,
+    timings: Optional[StageTimings] = None
+) -> AsyncIterator[bytes]:
+    """
+    Encode images in a stream_executor thread and yield the PDF as each page is finished.
+
+    At most STREAM_WORKERS streams encode at once; others wait for a slot
+    before taking any thread, including the one that waits for chunks.
+
+    Args:
+        images: Encoded image contents or paths of image files, in page order
+        resample: Resampling settings from resample_options(), if any
+        names: Image names; when given, every image's encode report is logged
+        timings: Stage timings of the request so far; when given, the read,
+            encode and write times are added and logged once the PDF is
+            complete. Write time is time spent waiting for the client.
+
+    Yields:
+        PDF bytes: the header, then one chunk per page, then the trailer
+    """
+    sink = PageChunkQueue(maxsize=STREAM_QUEUE_PAGES)
+
+    def produce():
+        writer = None
+        started = time.perf_counter()
+        metrics.conversions_in_flight.inc()
+        try:
+            source = images
+            if resample is not None:
+                source = resample_images(images, **resample, max_threads=RESAMPLE_THREADS)
+            with StreamingPdfWriter(
+                sink, fragment_cache=get_fragment_cache(), report_images=names is not None,
+                time_stages=timings is not None
+            ) as writer:
+                for index, image in enumerate(source):
+                    name = names[index] if names is not None else None
+                    if isinstance(image, Path):
+                        writer.add_image_file(image, name)
+                    else:
+                        writer.add_image(image, name)
+            sink.close()
+            if names is not None:
+                log_image_reports("streamed upload", writer.image_reports)
+            if timings is not None:
+                timings.update(writer.stage_seconds)
+                log_stage_timings("streamed upload", timings.finish())
+            metrics.record_conversion("upload", {
+                "images_converted": len(images),
+                "pages": writer.page_count,
+                "bytes_in": sum(len(image) if isinstance(image, bytes) else image.stat().st_size for image in images),
+                "bytes_out": writer.bytes_written,
+            }, time.perf_counter() - started)
+        except Exception as e:
+            metrics.record_error("upload", e)
+            sink.close(e)
+        finally:
+            metrics.conversions_in_flight.dec()
+            if writer is not None:
+                record_fragment_stats({"fragment_cache": {
+                    "hits": writer.fragment_hits,
+                    "misses": writer.fragment_misses,
+                }})
+
+    async with get_stream_slots():
+        producer = asyncio.get_running_loop().run_in_executor(
+            stream_executor, partial(call_with_request_id, current_request_id(), produce)
+        )
+        try:
+            while True:
+                chunk = await run_in_threadpool(sink.chunks.get)
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    # Headers are already sent, so the client sees a truncated PDF
+                    logger.error(f"Error during streaming conversion: {str(chunk)}")
+                    raise chunk
+                yield chunk
+        finally:
+            # Unblocks the encoder if the client disconnected early
+            sink.cancelled.set()
+            await producer
+
+
+def open_cached_file(cache_key: str) -> Optional[BinaryIO]:
+    """
+    Open a result cache entry for sending.
+
+    The open file stays readable if a concurrent store evicts the entry
+    while the response is being sent.
+
+    Args:
+        cache_key: Result cache key
+
+    Returns:
+        The open file, or None on a miss
+    """
+    cached_pdf = result_cache.get(cache_key)
+    if cached_pdf is None:
+        return None
+    try:
+        return open(cached_pdf, "rb")
+    except FileNotFoundError:
+        # Evicted since the lookup
+        return None
+
+
+async def read_file_chunks(f: BinaryIO) -> AsyncIterator[bytes]:
+    """Yield an open file's contents in chunks without blocking the event loop, then close it"""
+    try:
+        while chunk := await run_in_threadpool(f.read, UPLOAD_CHUNK_SIZE):
+            yield chunk
+    finally:
+        f.close()
+
+
+def encode_path_headers(converted: dict) -> dict:
+    """Log an upload's image reports and summarize them in a response header"""
+    image_reports = converted.get("image_reports")
+    if image_reports is None:
+        return {}
+    log_image_reports("upload", image_reports)
+    counts = summarize_image_reports(image_reports)
+    return {"X-Encode-Paths": ", ".join(f"{path}={count}" for path, count in counts.items())}
+
+
+def upload_label(upload_files: List[UploadFile], shown: int = 3) -> str:
+    """Describe an upload by its file count and first file names"""
+    names = ", ".join(f.filename or "?" for f in upload_files[:shown])
+    more = ", ..." if len(upload_files) > shown else ""
+    return f"{len(upload_files)} files: {names}{more}"
+
+
+def server_timing_headers(timings: StageTimings) -> dict:
+    """Log an upload's stage timings and return them as a Server-Timing header"""
+    timings_ms = timings.finish()
+    log_stage_timings("upload", timings_ms)
+    return {"Server-Timing": server_timing_header(timings_ms)}
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware enforcing the per-request upload limit and admission
+    control while the body is received.
+
+    Requests whose Content-Length exceeds the limit are rejected before
+    any of the body is read. Bodies without one (chunked transfer encoding)
+    or with a wrong one are counted as they arrive, and receiving stops
+    with a 413 as soon as they pass the limit, before Starlette spools the
+    rest.
+
+    Uploads are then admitted with their Content-Length as the cost, or the
+    request limit when it is not sent, and scratch space is reserved for
+    everything they write to disk, so an overloaded server sheds them
+    before receiving their bodies. The scratch lease is passed to the
+    endpoint as `request.state.upload_scratch`; an endpoint that reserves
+    one itself stores it there too. Both are held until the response,
+    streamed or not, has been sent.
+    """
+
+    def __init__(self, app, path: str = "/convert/upload"):
+        self.app = app
+        self.path = path
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        limit = MAX_UPLOAD_REQUEST_BYTES
+        content_length = dict(scope["headers"]).get(b"content-length", b"").decode("latin-1")
+        if content_length.isdigit() and int(content_length) > limit:
+            await self.reject(scope, receive, send, f"{content_length} bytes declared")
+            return
+
+        upload_bytes = int(content_length) if content_length.isdigit() else limit
+
+        try:
+            ticket = await admission.acquire(upload_bytes)
+        except AdmissionRejectedError as e:
+            await self.respond(scope, receive, send, admission_rejected("upload", e))
+            return
+        scratch_bytes = upload_scratch_bytes(upload_bytes)
+        try:
+            scratch = await reserve_upload_scratch(scratch_bytes) if scratch_bytes else None
+        except HTTPException as error:
+            admission.release(ticket)
+            await self.respond(scope, receive, send, error)
+            return
+        state = scope.setdefault("state", {})
+        state["upload_scratch"] = scratch
+        try:
+            await self.receive_within_limit(scope, receive, send)
+        finally:
+            # Reserved here or, for uploads declared too small, by the endpoint
+            scratch = state.get("upload_scratch")
+            if scratch is not None:
+                await scratch_space.release(scratch)
+            admission.release(ticket)
+
+    @staticmethod
+    async def respond(scope, receive, send, error: HTTPException) -> None:
+        """Send an HTTPException raised before the endpoint ran as its JSON response"""
+        response = JSONResponse(status_code=error.status_code, content={"detail": error.detail}, headers=error.headers)
+        await response(scope, receive, send)
+
+    async def receive_within_limit(self, scope, receive, send) -> None:
+        """Run the app, answering 413 instead once the body passes the limit"""
+        limit = MAX_UPLOAD_REQUEST_BYTES
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def receive_limited():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLargeError(f"Upload exceeds the limit of {limit} bytes")
+            return message
+
+        async def send_unless_exceeded(message) -> None:
+            nonlocal response_started
+            # The app's error response for the aborted body is replaced by a 413
+            if exceeded and not response_started:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_limited, send_unless_exceeded)
+        except UploadTooLargeError:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self.reject(scope, receive, send, f"over {limit} bytes received")
+
+    @staticmethod
+    async def reject(scope, receive, send, size: str) -> None:
+        """Send a 413 for an upload over the request limit and record it"""
+        error = UploadTooLargeError(f"Upload exceeds the limit of {MAX_UPLOAD_REQUEST_BYTES} bytes")
+        metrics.record_error("upload", error)
+        logger.warning(f"Rejected upload ({size}): {str(error)}")
+        response = JSONResponse(status_code=413, content={"detail": str(error)})
+        await response(scope, receive, send)
+
+
+# Middleware, innermost first: rejections by the upload limit are still timed by
+# the metrics middleware and carry a request ID
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+# Every request gets an ID, returned in X-Request-ID and attached to its log records
+app.add_middleware(RequestIdMiddleware)
+
+
 # API Endpoints
 
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -225,6 +2177,14 @@ async def root():
         "endpoints": {
             "POST /convert": "Convert images from a directory to PDF",
             "POST /convert/upload": "Upload images and convert to PDF",
+            "POST /jobs": "Queue a directory conversion and return its job ID",
+            "GET /jobs/{job_id}": "Status and progress of a queued conversion",
+            "POST /batch": "Convert many directories with a concurrency limit",
+            "GET /batch/{batch_id}": "Per-item results of a batch",
+            "GET /cache/stats": "Result and fragment cache counters",
+            "GET /metrics": "Prometheus metrics",
+            "GET /debug/memory": "Most memory-hungry recent conversions",
+            "GET /debug/capacity": "Admission control and scratch space usage",
             "GET /health": "Health check endpoint"
         }
     }
@@ -236,93 +2196,342 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Request, conversion and throughput metrics in the Prometheus text format"""
+    return Response(content=metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/debug/memory")
+async def debug_memory():
+    """The most memory-hungry recent profiled conversions, largest first"""
+    return {
+        "profile_all": MEMORY_PROFILE,
+        "profiled": memory_leaderboard.profiled,
+        "window_seconds": memory_leaderboard.window_seconds,
+        "top": memory_leaderboard.top(),
+    }
+
+
+@app.get("/debug/capacity")
+async def debug_capacity():
+    """Admission control limits and load, and scratch space usage"""
+    return {"admission": admission.stats(), "scratch_space": scratch_space.stats()}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Result and fragment cache hit, miss and eviction counters"""
+    stats = {"result_cache": {"enabled": False}, "fragment_cache": {"enabled": False}}
+    if result_cache is not None:
+        stats["result_cache"] = {"enabled": True, **result_cache.stats()}
+
+    fragment_cache = await run_in_threadpool(get_fragment_cache)
+    if fragment_cache is not None:
+        usage = await run_in_threadpool(fragment_cache.stats)
+        lookups = fragment_cache_counters["hits"] + fragment_cache_counters["misses"]
+        stats["fragment_cache"] = {
+            "enabled": True,
+            "entries": usage["entries"],
+            "bytes": usage["bytes"],
+            "max_bytes": usage["max_bytes"],
+            **fragment_cache_counters,
+            "hit_rate": round(fragment_cache_counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+    return stats
+
+
 @app.post("/convert", response_model=ConversionResponse)
-async def convert_directory_to_pdf(request: ConversionRequest):
+async def convert_directory_to_pdf(
+    request: ConversionRequest,
+    response: Response,
+    x_memory_profile: Optional[str] = Header(None, description="Set to 1 to profile the conversion's memory use")
+):
     """
     Convert all images in a directory to a PDF file.
 
     Args:
         request: ConversionRequest with input_dir and output_pdf_path
+        response: Response whose headers carry the memory profile
+        x_memory_profile: Profile memory use and return it in the
+            X-Memory-Profile response header
 
     Returns:
         ConversionResponse with conversion results
     """
+    ticket = None
     try:
-        result = convert_images_to_pdf(
-            input_dir=request.input_dir,
-            output_pdf_path=request.output_pdf_path,
-            image_formats=request.image_formats,
-            sort_order=request.sort_order
-        )
+        # A full queue turns the request away before the directory is listed
+        admission.check_queue()
+        cost = await run_in_threadpool(directory_image_bytes, request) if admission.enabled else 0
+        ticket = await admission.acquire(cost)
+        result = await run_directory_conversion(request, profile=memory_profile_requested(x_memory_profile))
+        if "memory_profile" in result:
+            response.headers[MEMORY_PROFILE_HEADER] = memory_profile_header(result["memory_profile"])
         return ConversionResponse(**result)
 
+    except AdmissionRejectedError as e:
+        raise admission_rejected("convert", e)
     except ValueError as e:
+        metrics.record_error("convert", e)
         raise HTTPException(status_code=400, detail=str(e))
     except IOError as e:
+        metrics.record_error("convert", e)
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
+        metrics.record_error("convert", e)
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        if ticket is not None:
+            admission.release(ticket)
+
+
+@app.post("/jobs", response_model=JobStatusResponse, status_code=202)
+async def submit_conversion_job(request: ConversionRequest):
+    """
+    Queue a directory conversion and return immediately.
+
+    Args:
+        request: ConversionRequest with input_dir and output_pdf_path
+
+    Returns:
+        JobStatusResponse with the job ID to poll
+    """
+    try:
+        job = job_manager.submit(request)
+    except JobQueueFullError as e:
+        metrics.record_error("jobs", e)
+        raise HTTPException(status_code=503, detail=str(e))
+    logger.info(f"Queued job {job.job_id} for '{request.input_dir}'")
+    return JobStatusResponse(**job.to_dict())
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_conversion_job(job_id: str):
+    """
+    Report the status of a queued conversion.
+
+    Args:
+        job_id: ID returned by POST /jobs
+
+    Returns:
+        JobStatusResponse with status, pages done so far and, once finished,
+        the conversion result or error
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return JobStatusResponse(**job.to_dict())
+
+
+@app.post("/batch", response_model=BatchStatusResponse, status_code=202)
+async def convert_batch(
+    request: BatchRequest,
+    stream: bool = Query(False, description="Send item results as newline-delimited JSON as they finish")
+):
+    """
+    Convert many directories in one request.
+
+    Items run in parallel up to the concurrency limit. By default the batch
+    runs in the background and its ID is returned for polling; with
+    stream=true the item results are sent back as they complete.
+
+    Args:
+        request: BatchRequest with one ConversionRequest per directory
+        stream: Stream item results instead of returning a batch ID
+
+    Returns:
+        BatchStatusResponse, or a newline-delimited JSON stream of item results
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No batch items provided")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch has {len(request.items)} items; the limit is {BATCH_MAX_ITEMS}"
+        )
+    concurrency = min(request.max_concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+
+    if stream:
+        batch = ConversionBatch(request.items, concurrency)
+        logger.info(f"Streaming batch {batch.batch_id} of {len(request.items)} items")
+        return StreamingResponse(stream_batch_results(batch), media_type="application/x-ndjson")
+
+    batch = job_manager.submit_batch(request.items, run_batch_item, concurrency)
+    logger.info(f"Started batch {batch.batch_id} of {len(request.items)} items")
+    return BatchStatusResponse(**batch.to_dict(include_results=False))
+
+
+@app.get("/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch(batch_id: str):
+    """
+    Report the progress of a batch.
+
+    Args:
+        batch_id: ID returned by POST /batch
+
+    Returns:
+        BatchStatusResponse with the results of the items finished so far
+    """
+    batch = job_manager.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch '{batch_id}' not found")
+    return BatchStatusResponse(**batch.to_dict())
 
 
 @app.post("/convert/upload")
 async def convert_uploaded_images(
-    files: List[UploadFile] = File(..., description="Image files to convert")
+    request: Request,
+    files: List[UploadFile] = File(..., description="Image files to convert"),
+    stream: bool = Query(False, description="Send PDF pages as soon as they are encoded"),
+    max_dimension: Optional[int] = Query(None, description="Downscale images larger than this many pixels"),
+    target_dpi: Optional[float] = Query(None, description="Downscale images above this resolution"),
+    jpeg_quality: int = Query(DEFAULT_JPEG_QUALITY, description="JPEG quality (1-100) for downscaled images"),
+    report_encoding: bool = Query(REPORT_ENCODING, description="Report how each image was embedded"),
+    timings: bool = Query(REPORT_TIMINGS, description="Report stage timings in a Server-Timing header"),
+    x_memory_profile: Optional[str] = Header(None, description="Set to 1 to profile the conversion's memory use")
 ):
     """
     Upload images and convert them to a PDF file.
 
     Args:
+        request: The request, carrying the scratch lease reserved by
+            UploadLimitMiddleware
         files: List of image files to upload and convert
+        stream: Send the PDF with chunked transfer encoding while it is
+            being produced instead of after the whole file is written
+        max_dimension: Downscale images whose width or height exceeds this
+        target_dpi: Downscale images whose resolution exceeds this
+        jpeg_quality: JPEG quality for downscaled images
+        report_encoding: Log every image's encode path, size and encode
+            time, and summarize the paths in the X-Encode-Paths header
+        timings: Log the time spent receiving, reading, encoding and writing
+            and send it in a Server-Timing header; streamed responses only
+            cover receiving, since their headers go out before encoding
+        x_memory_profile: Profile the conversion's memory use and return it
+            in the X-Memory-Profile response header (not for streamed
+            responses)
 
     Returns:
         PDF file as a download
     """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
+    metrics.upload_bytes.observe(sum(f.size or 0 for f in files))
 
-    temp_dir = None
-    output_pdf = None
+    # Reserved and removed by UploadLimitMiddleware once the response has been sent
+    scratch: Optional[ScratchLease] = getattr(request.state, "upload_scratch", None)
+    pdf_headers = {"Content-Disposition": 'attachment; filename="converted.pdf"'}
+    stage_timings = StageTimings()
 
     try:
-        # Create temporary directory for uploaded files
-        temp_dir = Path(tempfile.mkdtemp())
+        resample = resample_options(max_dimension, target_dpi, jpeg_quality)
+
+        # Small uploads are converted straight from memory
+        in_memory = fits_in_memory(files, IN_MEMORY_UPLOAD_BYTES)
+        with stage_timings.stage("receive"):
+            if in_memory:
+                images = await read_upload_files(files)
+            else:
+                if scratch is None:
+                    # Declared too small for the middleware to reserve space for
+                    # the copies; it still removes the directory afterwards
+                    if any(f.size is None for f in files):
+                        upload_bytes = MAX_UPLOAD_REQUEST_BYTES
+                    else:
+                        upload_bytes = sum(f.size for f in files)
+                    scratch = await reserve_upload_scratch(2 * upload_bytes)
+                    request.state.upload_scratch = scratch
+                # Uploaded files and the output PDF go to the reserved scratch directory
+                images = await save_upload_files(files, scratch.path)
+                logger.info(f"Saved {len(images)} files to scratch directory '{scratch.path}'")
+
+        cache_key = None
+        # A cached PDF carries no encode report, so reports always convert
+        if result_cache is not None and not report_encoding:
+            cache_options = UPLOAD_CACHE_OPTIONS if resample is None else {**UPLOAD_CACHE_OPTIONS, "resample": resample}
+            with stage_timings.stage("cache"):
+                cache_key = await run_in_threadpool(PdfResultCache.key_for, images, cache_options)
+                cached_pdf = await run_in_threadpool(open_cached_file, cache_key)
+            if cached_pdf is not None:
+                logger.info(f"Serving cached PDF for {len(files)} images")
+                pdf_headers["Content-Length"] = str(os.fstat(cached_pdf.fileno()).st_size)
+                if timings:
+                    pdf_headers.update(server_timing_headers(stage_timings))
+                return StreamingResponse(read_file_chunks(cached_pdf), media_type="application/pdf", headers=pdf_headers)
+
+        names = [f.filename or f"#{index}" for index, f in enumerate(files)] if report_encoding else None
+        profile_label = upload_label(files) if memory_profile_requested(x_memory_profile) else None
+
+        if stream:
+            if timings:
+                pdf_headers["Server-Timing"] = server_timing_header(stage_timings.milliseconds())
+            return StreamingResponse(
+                stream_pdf_chunks(images, resample, names, stage_timings if timings else None),
+                media_type="application/pdf",
+                headers=pdf_headers
+            )
 
-        # Save uploaded files
-        saved_files = await save_upload_files(files, temp_dir)
-        logger.info(f"Saved {len(saved_files)} files to temporary directory")
+        if in_memory:
+            converted = await run_conversion(
+                "upload", convert_image_data, images, resample, names, timings, profile_label=profile_label
+            )
+            record_fragment_stats(converted)
+            pdf_headers.update(encode_path_headers(converted))
+            if "memory_profile" in converted:
+                pdf_headers[MEMORY_PROFILE_HEADER] = memory_profile_header(converted["memory_profile"])
+            if timings:
+                stage_timings.update(converted["stage_seconds"])
+                pdf_headers.update(server_timing_headers(stage_timings))
+            pdf_bytes = converted["pdf"]
+            if cache_key is not None:
+                await run_in_threadpool(result_cache.put_bytes, cache_key, pdf_bytes)
+            logger.info(f"Successfully converted {len(files)} images to PDF in memory")
+            return Response(content=pdf_bytes, media_type="application/pdf", headers=pdf_headers)
 
         # Convert to PDF
-        output_pdf = temp_dir / "output.pdf"
-        image_paths = [str(f) for f in saved_files]
+        output_pdf = scratch.path / "output.pdf"
+        image_paths = [str(f) for f in images]
 
-        with open(output_pdf, "wb") as f:
-            f.write(img2pdf.convert(image_paths))
+        converted = await run_conversion(
+            "upload", convert_image_files, image_paths, str(output_pdf), resample, names, timings,
+            profile_label=profile_label
+        )
+        record_fragment_stats(converted)
+        if cache_key is not None:
+            await run_in_threadpool(result_cache.put_file, cache_key, output_pdf)
 
         logger.info(f"Successfully converted {len(files)} images to PDF")
 
-        # Return the PDF file
+        response_headers = encode_path_headers(converted)
+        if "memory_profile" in converted:
+            response_headers[MEMORY_PROFILE_HEADER] = memory_profile_header(converted["memory_profile"])
+        if timings:
+            stage_timings.update(converted["stage_seconds"])
+            response_headers.update(server_timing_headers(stage_timings))
+
+        # Return the PDF file; the scratch directory is removed once it has been sent
         return FileResponse(
             path=output_pdf,
             media_type="application/pdf",
-            filename="converted.pdf"
+            filename="converted.pdf",
+            headers=response_headers
         )
 
+    except HTTPException:
+        # Scratch space rejections, already recorded
+        raise
+    except UploadTooLargeError as e:
+        metrics.record_error("upload", e)
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
+        metrics.record_error("upload", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        metrics.record_error("upload", e)
         logger.error(f"Error during upload conversion: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
-    finally:
-        # Clean up temporary files after response is sent
-        # Note: FileResponse will handle the file, so we clean up in the background
-        if temp_dir and temp_dir.exists():
-            try:
-                # We need to delay cleanup to allow FileResponse to serve the file
-                # In production, consider using a background task
-                pass  # Cleanup will happen automatically when temp directory is garbage collected
-            except Exception as e:
-                logger.error(f"Error cleaning up temporary files: {str(e)}")
 
 
 # Command-line interface
@@ -356,6 +2565,75 @@ if __name__ == "__main__":
         default="name",
         help="Sort order for images"
     )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Write the PDF page by page to keep memory usage flat"
+    )
+    parser.add_argument(
+        "--use-index",
+        action="store_true",
+        help="Reuse the cached directory listing while the directory is unchanged"
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="Only add images that are new since the output PDF was last built"
+    )
+    parser.add_argument(
+        "--preflight",
+        choices=["reject", "skip"],
+        default=PREFLIGHT_POLICY,
+        help="Check image headers before encoding and reject the job or skip bad files"
+    )
+    parser.add_argument(
+        "--max-dimension",
+        type=int,
+        help="Downscale images whose width or height exceeds this many pixels"
+    )
+    parser.add_argument(
+        "--target-dpi",
+        type=float,
+        help="Downscale images above this resolution, keeping their page size"
+    )
+    parser.add_argument(
+        "--jpeg-quality",
+        type=int,
+        default=DEFAULT_JPEG_QUALITY,
+        help="JPEG quality (1-100) for downscaled images"
+    )
+    parser.add_argument(
+        "--memory-map",
+        action="store_true",
+        default=MEMORY_MAP_INPUT,
+        help="Memory-map input images instead of reading them into memory"
+    )
+    parser.add_argument(
+        "--report-encoding",
+        action="store_true",
+        default=REPORT_ENCODING,
+        help="Print how each image was embedded, its size and encode time"
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        default=REPORT_TIMINGS,
+        help="Print the time spent in each conversion stage"
+    )
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        help="Convert a directory tree to one PDF per folder (for convert mode)"
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        help="With --recursive, make one PDF per folder at this depth, including its subfolders"
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Root of the mirrored output tree (for --recursive)"
+    )
     parser.add_argument(
         "--host",
         default="0.0.0.0",
@@ -367,13 +2645,75 @@ if __name__ == "__main__":
         default=8000,
         help="API server port (for api mode)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=CONVERSION_WORKERS,
+        help="Conversion worker processes, 0 to convert in-process"
+    )
+    parser.add_argument(
+        "--max-tasks-per-child",
+        type=int,
+        default=CONVERSION_MAX_TASKS_PER_CHILD,
+        help="Conversions a worker process runs before it is replaced, 0 for no limit"
+    )
+    parser.add_argument(
+        "--job-workers",
+        type=int,
+        default=JOB_WORKERS,
+        help="Queued jobs converted at the same time (for api mode)"
+    )
+    parser.add_argument(
+        "--no-warm-start",
+        action="store_true",
+        help="Start conversion workers lazily instead of at server startup"
+    )
 
     args = parser.parse_args()
 
     if args.mode == "api":
         # Run API server
+        conversion_executor = ConversionExecutor(
+            max_workers=args.workers,
+            max_tasks_per_child=args.max_tasks_per_child,
+            warm_start=not args.no_warm_start
+        )
+        job_manager.workers = max(1, args.job_workers)
         logger.info(f"Starting API server on {args.host}:{args.port}")
-        uvicorn.run(app, host=args.host, port=args.port)
+        # No uvicorn logging config: its records go through the queued root handler too
+        uvicorn.run(app, host=args.host, port=args.port, log_config=None)
+    elif args.recursive:
+        # Tree conversion mode
+        if not args.input_dir or not args.output_dir:
+            parser.error("--input-dir and --output-dir are required for --recursive")
+
+        tree = convert_directory_tree(
+            input_root=args.input_dir,
+            output_root=args.output_dir,
+            depth=args.depth,
+            image_formats=args.formats,
+            sort_order=args.sort,
+            streaming=args.streaming,
+            workers=args.workers,
+            preflight=args.preflight,
+            max_dimension=args.max_dimension,
+            target_dpi=args.target_dpi,
+            jpeg_quality=args.jpeg_quality,
+            memory_map=args.memory_map
+        )
+        for result in tree["results"]:
+            if result.get("error"):
+                print(f"FAILED {result['input_dir']}: {result['message']}")
+        summary = tree["summary"]
+        print(
+            f"Converted {summary['images_converted']} images in "
+            f"{summary['folders_converted']}/{summary['folders']} folders "
+            f"({summary['folders_failed']} failed, {summary['folders_empty']} empty) "
+            f"in {summary['elapsed_seconds']}s: "
+            f"{summary['images_per_second']} images/s, "
+            f"{summary['folders_per_second']} folders/s, "
+            f"{summary['output_mb_per_second']} MB/s written"
+        )
     else:
         # Direct conversion mode
         if not args.input_dir or not args.output_pdf:
@@ -383,6 +2723,25 @@ if __name__ == "__main__":
             input_dir=args.input_dir,
             output_pdf_path=args.output_pdf,
             image_formats=args.formats,
-            sort_order=args.sort
+            sort_order=args.sort,
+            streaming=args.streaming,
+            use_index=args.use_index,
+            append=args.append,
+            preflight=args.preflight,
+            max_dimension=args.max_dimension,
+            target_dpi=args.target_dpi,
+            jpeg_quality=args.jpeg_quality,
+            report_encoding=args.report_encoding,
+            memory_map=args.memory_map,
+            time_stages=args.timings
         )
+        for skipped in result.get("images_skipped") or []:
+            print(f"Skipped {skipped}")
+        for report in result.get("image_reports") or []:
+            print(
+                f"{report['name']}: {report['path']}, {report['bytes_in']} -> "
+                f"{report['bytes_out']} bytes, {report['encode_ms']} ms"
+            )
+        if result.get("timings"):
+            print("Timings: " + ", ".join(f"{name} {value} ms" for name, value in result["timings"].items()))
         print(result["message"])
@@ -0,0 +1,699 @@
+"""
+Streaming PDF Writer
+Writes image pages to an output file object one page at a time, so that peak
+memory stays at roughly a single page no matter how many images are converted.
+Page objects are serialized with img2pdf's internal engine; only object
+offsets and page ids are kept in memory until the document is closed.
+Multi-page TIFFs and animated GIFs are expanded one frame at a time from a
+memory-mapped file, so a fax with hundreds of pages never has more than one
+decoded frame in memory.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import img2pdf
+from PIL import Image, TiffImagePlugin
+
+logger = logging.getLogger(__name__)
+
+# Objects 1-3 are reserved for the document info, the catalog and the page
+# tree. They are written last because the page tree must list every page.
+INFO_ID = 1
+CATALOG_ID = 2
+PAGES_ID = 3
+FIRST_PAGE_OBJECT_ID = 4
+
+PDF_VERSION = "1.3"
+
+# Largest page side allowed by the PDF specification (200 inches)
+MAX_PAGE_SIZE_PT = 14400.0
+
+# How an image's data ends up in the PDF
+ENCODE_JPEG_PASSTHROUGH = "jpeg_passthrough"
+ENCODE_PNG_IDAT = "png_idat"
+ENCODE_CCITT_PASSTHROUGH = "ccitt_passthrough"
+ENCODE_REENCODE = "decode_reencode"
+ENCODE_PATHS = (ENCODE_JPEG_PASSTHROUGH, ENCODE_PNG_IDAT, ENCODE_CCITT_PASSTHROUGH, ENCODE_REENCODE)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+# Offset of the interlace method byte in a PNG's leading IHDR chunk
+PNG_INTERLACE_OFFSET = 28
+
+# Formats that can hold many frames, which are expanded lazily
+TIFF_SIGNATURES = (b"II*\x00", b"MM\x00*")
+MULTI_FRAME_SIGNATURES = TIFF_SIGNATURES + (b"GIF8",)
+
+# Maps each byte to its bit-reversed value, for TIFFs with FillOrder 2
+REVERSED_BITS = bytes(img2pdf.TIFFBitRevTable)
+
+
+def _reference(identifier: int) -> img2pdf.MyPdfDict:
+    """Return a placeholder object that serializes as 'N 0 R'."""
+    ref = img2pdf.MyPdfDict()
+    ref.identifier = identifier
+    return ref
+
+
+def read_image_frames(rawdata: bytes) -> List[tuple]:
+    """
+    Prepare an image's frames with img2pdf.read_images.
+
+    img2pdf refuses images whose EXIF orientation is mirrored or invalid;
+    that orientation is ignored with a warning instead, so such JPEGs are
+    still embedded as-is rather than failing the conversion.
+    """
+    return img2pdf.read_images(rawdata, None, rot=img2pdf.Rotation.ifvalid)
+
+
+def encode_path(rawdata: bytes, frames: List[tuple]) -> str:
+    """
+    Tell how img2pdf embedded an image from its input and prepared frames.
+
+    Returns:
+        ENCODE_JPEG_PASSTHROUGH if the JPEG data is embedded unchanged,
+        ENCODE_PNG_IDAT if the PNG's compressed IDAT data is reused,
+        ENCODE_CCITT_PASSTHROUGH if a fax TIFF's Group 4 data is copied, and
+        ENCODE_REENCODE if the pixels were decoded and compressed again
+    """
+    formats = {frame[2] for frame in frames}
+    if formats == {img2pdf.ImageFormat.JPEG}:
+        # img2pdf never produces JPEG data itself
+        return ENCODE_JPEG_PASSTHROUGH
+    if (
+        formats == {img2pdf.ImageFormat.CCITTGroup4}
+        and rawdata[:4] in TIFF_SIGNATURES
+        and all(rawdata.find(frame[3]) >= 0 for frame in frames)
+    ):
+        return ENCODE_CCITT_PASSTHROUGH
+    if (
+        len(frames) == 1
+        and formats == {img2pdf.ImageFormat.PNG}
+        and rawdata[:8] == PNG_SIGNATURE
+        and rawdata[PNG_INTERLACE_OFFSET] == 0
+        and frames[0][4] is None
+        and frames[0][3] == img2pdf.parse_png(rawdata)[0]
+    ):
+        return ENCODE_PNG_IDAT
+    return ENCODE_REENCODE
+
+
+def _mapped_jpeg_frame(mapped: mmap.mmap) -> Optional[tuple]:
+    """
+    Prepare a memory-mapped JPEG for embedding without copying it.
+
+    Only the header is parsed; the frame's image data is the mapping itself,
+    which the writer passes to the output stream as is. Returns None for
+    anything img2pdf has to handle itself (other formats, MPO, and JPEGs it
+    refuses, so that its error is raised).
+    """
+    if mapped[:3] != JPEG_SIGNATURE:
+        return None
+    mapped.seek(0)
+    with Image.open(mapped) as img:
+        if img.format != "JPEG":
+            return None
+        color, ndpi, width, height, rotation, iccp = img2pdf.get_imgmetadata(
+            img, img2pdf.ImageFormat.JPEG, img2pdf.default_dpi, None, rotreq=img2pdf.Rotation.ifvalid
+        )
+    if color in (img2pdf.Colorspace["1"], img2pdf.Colorspace.P, img2pdf.Colorspace.RGBA):
+        return None
+    return (color, ndpi, img2pdf.ImageFormat.JPEG, mapped, None, width, height, [], False, 8, rotation, iccp)
+
+
+def _ccitt_frame(img: Image.Image, fp) -> Optional[tuple]:
+    """
+    Copy the current frame of a CCITT Group 4 TIFF without decoding it.
+
+    Mirrors img2pdf's passthrough for single-strip Group 4 data; returns None
+    for frames that have to be decoded instead. That includes Group 4 frames
+    stored in several strips, as Pillow writes them: every strip is coded
+    on its own, so their data cannot simply be joined into one stream.
+    """
+    if img.format != "TIFF" or img.info.get("compression") != "group4":
+        return None
+    tags = img.tag_v2
+    photometric = tags.get(TiffImagePlugin.PHOTOMETRIC_INTERPRETATION)
+    fill_order = tags.get(TiffImagePlugin.FILLORDER, 1)
+    if (
+        len(tags.get(TiffImagePlugin.STRIPOFFSETS, ())) != 1
+        or len(tags.get(TiffImagePlugin.STRIPBYTECOUNTS, ())) != 1
+        or photometric not in (0, 1)
+        or fill_order not in (1, 2)
+    ):
+        return None
+
+    color, ndpi, width, height, rotation, iccp = img2pdf.get_imgmetadata(
+        img, img2pdf.ImageFormat.TIFF, img2pdf.default_dpi, None, rotreq=img2pdf.Rotation.ifvalid
+    )
+    offset, length = img2pdf.ccitt_payload_location_from_pil(img)
+    fp.seek(offset)
+    data = fp.read(length)
+    if fill_order == 2:
+        data = data.translate(REVERSED_BITS)
+    inverted = photometric == 0
+    return (color, ndpi, img2pdf.ImageFormat.CCITTGroup4, data, None, width, height, [], inverted, 1, rotation, iccp)
+
+
+def _frame_dpi(img: Image.Image) -> Tuple[float, float]:
+    """Return the resolution img2pdf lays out the current frame at."""
+    try:
+        return img2pdf.get_imgmetadata(
+            img, img2pdf.ImageFormat[img.format], img2pdf.default_dpi, None, rotreq=img2pdf.Rotation.ifvalid
+        )[1]
+    except img2pdf.AlphaChannelError:
+        # Transparent TIFF frames, which img2pdf only embeds once they are PNG
+        return img.info.get("dpi", (img2pdf.default_dpi, img2pdf.default_dpi))
+
+
+def _encode_frame(img: Image.Image) -> tuple:
+    """
+    Save the current frame as a standalone image and prepare it with img2pdf.
+
+    Bilevel frames are stored as Group 4 and CMYK frames as TIFF, which
+    img2pdf embeds the same way it would have from the original file; all
+    other frames as PNG, whose compressed data img2pdf reuses.
+    """
+    params = {"icc_profile": img.info.get("icc_profile"), "dpi": _frame_dpi(img)}
+    buffer = BytesIO()
+    if img.mode == "1":
+        img.save(buffer, format="TIFF", compression="group4", **params)
+    elif img.mode == "CMYK":
+        img.save(buffer, format="TIFF", **params)
+    else:
+        img.save(buffer, format="PNG", **params)
+    return read_image_frames(buffer.getvalue())[0]
+
+
+class StreamingPdfWriter:
+    """
+    Incrementally write a PDF document to a binary file object.
+
+    Usage:
+        with open("out.pdf", "wb") as f, StreamingPdfWriter(f) as writer:
+            for path in image_paths:
+                writer.add_image_file(path)
+
+    The output stream only needs to support write(); it does not have to be
+    seekable, so sockets and pipes work as well as regular files. If it has a
+    flush() method, it is called after the header and after every page.
+
+    With a fragment cache (see conversion_cache.FragmentCache), images that
+    were prepared for an earlier PDF are reused instead of parsed and
+    re-encoded again.
+
+    Passing the `state` of an earlier writer as `resume`, with the stream
+    positioned at the end of that PDF, appends pages as a PDF incremental
+    update instead of starting a new document.
+
+    With `report_images`, every added image is recorded in `image_reports`
+    with its encode path, bytes in and out and the time it took.
+
+    With `memory_map`, add_image_file maps image files instead of reading
+    them. A JPEG is then written to the output straight from the mapping,
+    without being copied into Python memory, and concurrent conversions of
+    the same files share the OS page cache. Files must not be truncated
+    while they are mapped.
+
+    With `time_stages`, `stage_seconds` accumulates the time spent reading
+    image files ('read'), preparing pages ('encode') and handing bytes to the
+    output stream ('write'). Pages of a memory-mapped file are read on first
+    access, so for mapped files that time shows up under encode and write.
+    """
+
+    def __init__(
+        self,
+        outputstream: BinaryIO,
+        layout_fun=img2pdf.default_layout_fun,
+        fragment_cache=None,
+        resume: Optional[dict] = None,
+        report_images: bool = False,
+        memory_map: bool = False,
+        time_stages: bool = False
+    ):
+        self._stream = outputstream
+        self._layout_fun = layout_fun
+        self._fragment_cache = fragment_cache
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self.report_images = report_images
+        self.memory_map = memory_map
+        self.image_reports: List[dict] = []
+        self.stage_seconds: Optional[Dict[str, float]] = (
+            {"read": 0.0, "encode": 0.0, "write": 0.0} if time_stages else None
+        )
+        self._offsets: Dict[int, int] = {}
+        self._closed = False
+        self._startxref: Optional[int] = None
+
+        if resume is not None:
+            # Continue a PDF written earlier: new objects go after its trailer
+            # and close() writes an incremental update pointing back at it
+            self._pos = resume["size"]
+            self._next_id = resume["next_id"]
+            self._page_ids: List[int] = list(resume["page_ids"])
+            self._version = resume["version"]
+            self._prev_startxref: Optional[int] = resume["startxref"]
+            self._first_new_id = self._next_id
+            return
+
+        self._pos = 0
+        self._next_id = FIRST_PAGE_OBJECT_ID
+        self._page_ids = []
+        self._version = PDF_VERSION
+        self._prev_startxref = None
+        self._first_new_id = FIRST_PAGE_OBJECT_ID
+
+        # The binary comment tells transfer tools to treat the file as binary
+        self._write(b"%%PDF-%s\n%%\xe2\xe3\xcf\xd3\n" % PDF_VERSION.encode("ascii"))
+        self._flush()
+
+    def __enter__(self) -> "StreamingPdfWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages written so far"""
+        return len(self._page_ids)
+
+    @property
+    def bytes_written(self) -> int:
+        """Size of the PDF so far, including any part written before resuming"""
+        return self._pos
+
+    @property
+    def state(self) -> dict:
+        """
+        Everything needed to append to the closed PDF later with `resume`.
+
+        Raises:
+            ValueError: If the writer has not been closed yet
+        """
+        if not self._closed:
+            raise ValueError("The PDF writer has not been closed")
+        return {
+            "size": self._pos,
+            "startxref": self._startxref,
+            "next_id": self._next_id,
+            "page_ids": list(self._page_ids),
+            "version": self._version,
+        }
+
+    def add_image(self, rawdata: Union[bytes, mmap.mmap], name: Optional[str] = None) -> int:
+        """
+        Append every frame of an encoded image as a new page.
+
+        Multi-page TIFFs and animated GIFs are decoded and written one frame
+        at a time, bypassing the fragment cache.
+
+        Args:
+            rawdata: Encoded image file contents, or a memory map of the file
+            name: Name of the image in image_reports
+
+        Returns:
+            Number of pages added
+        """
+        if self._closed:
+            raise ValueError("Cannot add pages to a closed PDF writer")
+
+        started = time.perf_counter()
+        start_pos = self._pos
+        write_before = self.stage_seconds["write"] if self.stage_seconds is not None else 0.0
+        added = None
+        if rawdata[:4].startswith(MULTI_FRAME_SIGNATURES):
+            added = self._add_frames(rawdata)
+        if added is None:
+            frames = self._prepare_frames(rawdata)
+            for frame in frames:
+                self._add_page(*frame)
+            added = (len(frames), encode_path(rawdata, frames) if self.report_images else None)
+        pages, path = added
+
+        if self.stage_seconds is not None:
+            self.stage_seconds["encode"] += (
+                time.perf_counter() - started - (self.stage_seconds["write"] - write_before)
+            )
+        if self.report_images:
+            self.image_reports.append({
+                "name": name if name is not None else f"#{len(self.image_reports)}",
+                "path": path,
+                "pages": pages,
+                "bytes_in": len(rawdata),
+                "bytes_out": self._pos - start_pos,
+                "encode_ms": round((time.perf_counter() - started) * 1000, 2),
+            })
+        return pages
+
+    def add_image_file(self, path: Union[str, Path], name: Optional[str] = None) -> int:
+        """
+        Append every frame of an image file as a new page.
+
+        Multi-page TIFFs and animated GIFs are always memory-mapped, so their
+        frames are only paged in as they are written; other files are mapped
+        if the writer was created with memory_map and read otherwise.
+
+        Args:
+            path: Path of the image file
+            name: Name of the image in image_reports (default: the file name)
+
+        Returns:
+            Number of pages added
+        """
+        name = name if name is not None else Path(path).name
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files cannot be mapped; let img2pdf report them
+                return self.add_image(b"", name)
+            if not self.memory_map and not f.read(4).startswith(MULTI_FRAME_SIGNATURES):
+                f.seek(0)
+                if self.stage_seconds is None:
+                    return self.add_image(f.read(), name)
+                started = time.perf_counter()
+                rawdata = f.read()
+                self.stage_seconds["read"] += time.perf_counter() - started
+                return self.add_image(rawdata, name)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return self.add_image(mapped, name)
+
+    def _add_frames(self, rawdata: Union[bytes, mmap.mmap]) -> Optional[Tuple[int, str]]:
+        """
+        Write a multi-page TIFF or animated GIF frame by frame.
+
+        Returns:
+            Number of pages added and the encode path, or None if the image
+            has a single frame. The path is ENCODE_CCITT_PASSTHROUGH only if
+            every frame was copied; one decoded frame makes it ENCODE_REENCODE.
+        """
+        fp = rawdata if isinstance(rawdata, mmap.mmap) else BytesIO(rawdata)
+        with Image.open(fp) as img:
+            if not getattr(img, "is_animated", False):
+                return None
+            pages = 0
+            passthrough = True
+            while True:
+                try:
+                    img.seek(pages)
+                except EOFError:
+                    break
+                frame = _ccitt_frame(img, fp)
+                if frame is None:
+                    passthrough = False
+                    frame = _encode_frame(img)
+                self._add_page(*frame)
+                pages += 1
+        return pages, ENCODE_CCITT_PASSTHROUGH if passthrough else ENCODE_REENCODE
+
+    def _prepare_frames(self, rawdata: Union[bytes, mmap.mmap]) -> List[tuple]:
+        """Parse and encode an image, or fetch the result from the fragment cache."""
+        if self._fragment_cache is None:
+            if isinstance(rawdata, mmap.mmap):
+                frame = _mapped_jpeg_frame(rawdata)
+                if frame is not None:
+                    return [frame]
+                rawdata = rawdata[:]
+            return read_image_frames(rawdata)
+
+        # Hashing reads a mapping in place; it is only copied on a miss
+        key = hashlib.sha256(rawdata).hexdigest()
+        frames = self._fragment_cache.get_frames(key)
+        if frames is not None:
+            self.fragment_hits += 1
+            return frames
+
+        self.fragment_misses += 1
+        frames = read_image_frames(rawdata if isinstance(rawdata, bytes) else rawdata[:])
+        self._fragment_cache.put_frames(key, frames)
+        return frames
+
+    def close(self) -> None:
+        """Write the page tree, catalog, document info, xref table and trailer."""
+        if self._closed:
+            return
+        if not self._page_ids:
+            raise ValueError("Unable to write a PDF without pages")
+
+        pages = img2pdf.MyPdfDict(
+            Type=img2pdf.MyPdfName.Pages,
+            Kids=[_reference(page_id) for page_id in self._page_ids],
+            Count=len(self._page_ids),
+        )
+        pages.identifier = PAGES_ID
+
+        catalog = img2pdf.MyPdfDict(Type=img2pdf.MyPdfName.Catalog, Pages=pages)
+        catalog.identifier = CATALOG_ID
+        if self._version > PDF_VERSION:
+            # The header was written before the pages were known; /Version in
+            # the catalog overrides it for features such as /SMask (PDF 1.4)
+            catalog[img2pdf.MyPdfName.Version] = b"/" + self._version.encode("ascii")
+
+        now = ("(D:%s)" % datetime.now(tz=timezone.utc).strftime("%Y%m%d%H%M%SZ")).encode("ascii")
+        info = img2pdf.MyPdfDict(
+            Producer=img2pdf.MyPdfString.encode("img2pdf %s" % img2pdf.__version__),
+        )
+        if self._prev_startxref is None:
+            info[img2pdf.MyPdfName.CreationDate] = now
+        else:
+            info[img2pdf.MyPdfName.ModDate] = now
+        info.identifier = INFO_ID
+
+        for obj in (pages, catalog, info):
+            self._write_object(obj)
+
+        xref_offset = self._pos
+        if self._prev_startxref is None:
+            xref = [b"xref\n0 %d\n" % self._next_id, b"0000000000 65535 f \n"]
+            updated_ids = range(1, self._next_id)
+        else:
+            # An incremental update only lists the objects it (re)defines
+            xref = [b"xref\n%d 3\n" % INFO_ID]
+            xref.extend(b"%010d 00000 n \n" % self._offsets[i] for i in (INFO_ID, CATALOG_ID, PAGES_ID))
+            xref.append(b"%d %d\n" % (self._first_new_id, self._next_id - self._first_new_id))
+            updated_ids = range(self._first_new_id, self._next_id)
+        for identifier in updated_ids:
+            xref.append(b"%010d 00000 n \n" % self._offsets[identifier])
+        self._write(b"".join(xref))
+
+        trailer = {
+            b"/Size": self._next_id,
+            b"/Info": info,
+            b"/Root": catalog,
+        }
+        if self._prev_startxref is not None:
+            trailer[b"/Prev"] = self._prev_startxref
+        self._write(b"trailer\n" + img2pdf.parse(trailer) + b"\n")
+        self._write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+        self._flush()
+        self._startxref = xref_offset
+        self._closed = True
+
+    def _add_page(
+        self,
+        color,
+        ndpi,
+        imgformat,
+        imgdata,
+        smaskdata,
+        imgwidthpx,
+        imgheightpx,
+        palette,
+        inverted,
+        depth,
+        rotation,
+        iccp,
+    ) -> None:
+        """Lay out one decoded frame the way img2pdf.convert does and write it."""
+        pagewidth, pageheight, imgwidthpdf, imgheightpdf = self._layout_fun(
+            imgwidthpx, imgheightpx, ndpi
+        )
+
+        userunit = None
+        if pagewidth > MAX_PAGE_SIZE_PT or pageheight > MAX_PAGE_SIZE_PT:
+            userunit = img2pdf.find_scale(pagewidth, pageheight)
+            pagewidth /= userunit
+            pageheight /= userunit
+            imgwidthpdf /= userunit
+            imgheightpdf /= userunit
+
+        # A throwaway document builds the page objects; its info, catalog and
+        # page tree occupy the first three slots and are discarded
+        doc = img2pdf.pdfdoc(img2pdf.Engine.internal, self._version, nodate=True)
+        doc.add_imagepage(
+            color,
+            imgwidthpx,
+            imgheightpx,
+            imgformat,
+            imgdata,
+            smaskdata,
+            imgwidthpdf,
+            imgheightpdf,
+            (pagewidth - imgwidthpdf) / 2.0,
+            (pageheight - imgheightpdf) / 2.0,
+            pagewidth,
+            pageheight,
+            userunit,
+            palette,
+            inverted,
+            depth,
+            rotation,
+            iccp=iccp,
+        )
+        self._version = max(self._version, doc.output_version)
+
+        page_objects = doc.writer.objects[3:]
+        for obj in page_objects:
+            obj.identifier = self._next_id
+            self._next_id += 1
+
+        page = page_objects[0]
+        page[b"/Parent"] = _reference(PAGES_ID)
+        for obj in page_objects:
+            self._write_object(obj)
+        self._page_ids.append(page.identifier)
+        self._flush()
+
+    def _write_object(self, obj: img2pdf.MyPdfDict) -> None:
+        """Serialize one indirect object without copying its stream data."""
+        self._offsets[obj.identifier] = self._pos
+        header = b"%d 0 obj\n" % obj.identifier + img2pdf.parse(obj.content)
+        if obj.stream is None:
+            self._write(header + b"\nendobj\n")
+        else:
+            self._write(header + b"\nstream\n")
+            self._write(obj.stream)
+            self._write(b"\nendstream\nendobj\n")
+
+    def _write(self, data) -> None:
+        if self.stage_seconds is None:
+            self._stream.write(data)
+        else:
+            started = time.perf_counter()
+            self._stream.write(data)
+            self.stage_seconds["write"] += time.perf_counter() - started
+        self._pos += len(data)
+
+    def _flush(self) -> None:
+        """Hand everything written so far on, so consumers see whole pages."""
+        flush = getattr(self._stream, "flush", None)
+        if flush is None:
+            return
+        if self.stage_seconds is None:
+            flush()
+        else:
+            started = time.perf_counter()
+            flush()
+            self.stage_seconds["write"] += time.perf_counter() - started
+
+
+def write_images_streaming(
+    images: Iterable[Union[str, Path, bytes]],
+    outputstream: BinaryIO,
+    fragment_cache=None,
+    progress: Optional[Callable[[int], None]] = None,
+    report_images: bool = False,
+    names: Optional[Iterable[str]] = None,
+    memory_map: bool = False,
+    time_stages: bool = False
+) -> StreamingPdfWriter:
+    """
+    Write images to a PDF stream, reading one input file at a time.
+
+    Args:
+        images: Paths of the images or their contents, in page order
+        outputstream: Binary file object receiving the PDF
+        fragment_cache: Optional FragmentCache for prepared images
+        progress: Called with the number of pages written after each image
+        report_images: Record per-image encode reports on the writer
+        names: Image names for the reports (default: file names of paths,
+            positions of in-memory images)
+        memory_map: Memory-map image files instead of reading them
+        time_stages: Record stage timings on the writer; time spent waiting
+            for `images` to produce the next image counts as reading
+
+    Returns:
+        The closed writer, for its page count, cache counters, reports and
+        stage timings
+    """
+    names = iter(names) if names is not None else None
+    with StreamingPdfWriter(
+        outputstream, fragment_cache=fragment_cache, report_images=report_images,
+        memory_map=memory_map, time_stages=time_stages
+    ) as writer:
+        if time_stages:
+            images = _timed_iter(images, writer.stage_seconds, "read")
+        for image in images:
+            name = next(names, None) if names is not None else None
+            if isinstance(image, bytes):
+                writer.add_image(image, name)
+            else:
+                writer.add_image_file(image, name)
+            if progress is not None:
+                progress(writer.page_count)
+    return writer
+
+
+def _timed_iter(iterable: Iterable, stage_seconds: Dict[str, float], stage: str) -> Iterator:
+    """Yield from an iterable, adding the time spent waiting on it to a stage"""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stage_seconds[stage] += time.perf_counter() - started
+        yield item
+
+
+class PageChunkQueue:
+    """
+    Write-only stream that hands the PDF to a consumer one flushed chunk at a time.
+
+    StreamingPdfWriter flushes after every page, so each item placed on the
+    queue is a complete page (or the header / trailer). The queue is bounded,
+    which stops the producer from running ahead of a slow client.
+    """
+
+    def __init__(self, maxsize: int = 4):
+        self.chunks: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.cancelled = threading.Event()
+        self._buffer: List[bytes] = []
+
+    def write(self, data) -> int:
+        if self.cancelled.is_set():
+            raise IOError("PDF consumer went away")
+        self._buffer.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        if self._buffer:
+            chunk = b"".join(self._buffer)
+            self._buffer = []
+            self._put(chunk)
+
+    def close(self, error: Optional[Exception] = None) -> None:
+        """Signal the end of the PDF; an error is passed on to the consumer."""
+        self.flush()
+        self._put(error)
+
+    def _put(self, item) -> None:
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
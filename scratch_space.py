@@ -0,0 +1,251 @@
+"""
+Scratch Space
+Bounded working directories for conversions that spill to disk. Every
+directory is reserved against a byte quota before it is created; requests
+wait for space to be released, or are rejected, instead of filling the disk.
+Directories are removed once their response has been sent. Each server
+process keeps its directories under its own subdirectory of the root and
+touches a heartbeat file there; a background reaper removes another
+process's subdirectory once its heartbeat is older than the maximum age
+(e.g. left behind by a worker that crashed), so workers sharing a root
+never reap each other's live directories.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_PREFIX = "scratch-"
+PROCESS_PREFIX = "process-"
+HEARTBEAT_NAME = ".heartbeat"
+
+
+class ScratchSpaceFullError(RuntimeError):
+    """Raised when scratch space could not be reserved within the wait time"""
+
+
+class ScratchLease:
+    """A reserved scratch directory and the bytes held for it"""
+
+    def __init__(self, path: Path, reserved_bytes: int):
+        self.path = path
+        self.reserved_bytes = reserved_bytes
+        self.created_at = time.time()
+
+
+class ScratchSpace:
+    """
+    Scratch directories under one root, limited to a total byte quota.
+
+    Directories are created in a per-process subdirectory of the root, so
+    several server workers may share a root; the quota applies per process.
+    Reservations are estimates made before anything is written, so the
+    quota bounds what requests may use rather than measuring the disk. A
+    reservation may also cover files written elsewhere on the same disk,
+    such as a web framework's spooled uploads.
+
+    Usage:
+        lease = await scratch.reserve(2 * upload_bytes)
+        try:
+            ...  # write into lease.path
+        finally:
+            await scratch.release(lease)
+    """
+
+    def __init__(
+        self,
+        root: str,
+        quota_bytes: int,
+        wait_seconds: float = 30.0,
+        max_age_seconds: float = 3600.0,
+        reap_interval: float = 60.0
+    ):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.wait_seconds = wait_seconds
+        self.max_age_seconds = max_age_seconds
+        self.reap_interval = reap_interval
+        self.used_bytes = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.reaped = 0
+        self._leases: Dict[Path, ScratchLease] = {}
+        self._condition: Optional[asyncio.Condition] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    @property
+    def directory(self) -> Path:
+        """This process's subdirectory of the root, holding its scratch directories"""
+        return self.root / f"{PROCESS_PREFIX}{os.getpid()}"
+
+    async def start(self) -> None:
+        """Create this process's directory, reap directories left by earlier runs and start the reaper"""
+        if self._reaper is not None:
+            return
+        self._condition = asyncio.Condition()
+        await asyncio.to_thread(self.directory.mkdir, parents=True, exist_ok=True)
+        await self.reap()
+        self._reaper = asyncio.create_task(self._reap_periodically())
+        logger.info(f"Scratch space at '{self.directory}' (quota {self.quota_bytes} bytes)")
+
+    async def stop(self) -> None:
+        """Stop the reaper and remove this process's directory, unless directories are still in use"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+        if not self._leases:
+            await asyncio.to_thread(shutil.rmtree, self.directory, True)
+
+    async def reserve(self, nbytes: int) -> ScratchLease:
+        """
+        Reserve space and create a scratch directory.
+
+        Waits up to `wait_seconds` for other requests to release space;
+        with a wait of 0, a full quota rejects the request at once.
+
+        Args:
+            nbytes: Bytes the request expects to write
+
+        Returns:
+            The lease, whose path is the new directory
+
+        Raises:
+            ValueError: If nbytes exceeds the whole quota
+            ScratchSpaceFullError: If the space did not free up in time
+        """
+        if nbytes > self.quota_bytes:
+            raise ValueError(f"Request needs {nbytes} bytes of scratch space; the quota is {self.quota_bytes} bytes")
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        async with self._condition:
+            if self.used_bytes + nbytes > self.quota_bytes:
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self.used_bytes + nbytes <= self.quota_bytes),
+                        self.wait_seconds
+                    )
+                except asyncio.TimeoutError:
+                    self.rejected += 1
+                    raise ScratchSpaceFullError(
+                        f"Scratch space is full ({self.used_bytes} of {self.quota_bytes} bytes in use)"
+                    )
+                finally:
+                    self.waiting -= 1
+            self.used_bytes += nbytes
+
+        try:
+            path = await asyncio.to_thread(self._make_directory)
+        except Exception:
+            await self._unreserve(nbytes)
+            raise
+        lease = ScratchLease(path, nbytes)
+        self._leases[path] = lease
+        return lease
+
+    async def release(self, lease: ScratchLease) -> None:
+        """Remove a lease's directory and return its space; releasing twice is harmless"""
+        if self._leases.pop(lease.path, None) is None:
+            return
+        await asyncio.to_thread(shutil.rmtree, lease.path, True)
+        await self._unreserve(lease.reserved_bytes)
+
+    def _make_directory(self) -> Path:
+        directory = self.directory
+        directory.mkdir(parents=True, exist_ok=True)
+        return Path(tempfile.mkdtemp(prefix=DIRECTORY_PREFIX, dir=directory))
+
+    async def _unreserve(self, nbytes: int) -> None:
+        async with self._condition:
+            self.used_bytes -= nbytes
+            self._condition.notify_all()
+
+    async def reap(self) -> int:
+        """
+        Touch this process's heartbeat and remove scratch directories no live process holds.
+
+        Another process's subdirectory is removed once its heartbeat is older
+        than `max_age_seconds`; a live process touches its heartbeat every
+        `reap_interval`. In this process's own subdirectory, directories no
+        lease holds (left by an earlier process with the same ID) are removed
+        once older than `max_age_seconds`. Directories of current leases are
+        left alone however old, since a long conversion may still be using
+        them; those held past the maximum age are only logged.
+
+        Returns:
+            Number of directories removed
+        """
+        cutoff = time.time() - self.max_age_seconds
+        removed = 0
+        for lease in self._leases.values():
+            if lease.created_at < cutoff:
+                logger.warning(f"Scratch directory '{lease.path}' has been held for over {self.max_age_seconds}s")
+        await asyncio.to_thread(self._touch_heartbeat)
+        for path in await asyncio.to_thread(self._stale_orphans, cutoff):
+            await asyncio.to_thread(shutil.rmtree, path, True)
+            removed += 1
+        if removed:
+            self.reaped += removed
+            logger.info(f"Reaped {removed} scratch directories under '{self.root}'")
+        return removed
+
+    def _touch_heartbeat(self) -> None:
+        directory = self.directory
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / HEARTBEAT_NAME).touch()
+
+    def _stale_orphans(self, cutoff: float) -> list:
+        orphans = []
+        own = self.directory
+        try:
+            entries = list(os.scandir(self.root)) + list(os.scandir(own))
+        except FileNotFoundError:
+            return orphans
+        for entry in entries:
+            path = Path(entry.path)
+            if path == own or path in self._leases:
+                continue
+            try:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                if entry.name.startswith(PROCESS_PREFIX):
+                    # Another process's directory: stale once its heartbeat stops
+                    heartbeat = path / HEARTBEAT_NAME
+                    last_seen = heartbeat.stat().st_mtime if heartbeat.exists() else entry.stat().st_mtime
+                    if last_seen < cutoff:
+                        orphans.append(path)
+                elif entry.name.startswith(DIRECTORY_PREFIX) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    orphans.append(path)
+            except FileNotFoundError:
+                continue
+        return orphans
+
+    async def _reap_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Error reaping scratch space: {str(e)}")
+
+    def stats(self) -> dict:
+        """Return the quota, current use and counters"""
+        return {
+            "root": str(self.root),
+            "directory": str(self.directory),
+            "quota_bytes": self.quota_bytes,
+            "used_bytes": self.used_bytes,
+            "directories": len(self._leases),
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "reaped": self.reaped,
+        }